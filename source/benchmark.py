@@ -0,0 +1,186 @@
+"""\
+Benchmark the minimizers over tables, row counts, strategies and espresso flags.
+
+Every case runs in a fresh process so its peak RSS can be measured. After
+the warmup runs, every repetition records its wall time; the output cube
+count is recorded too. Results are written as JSON and can be compared
+against a stored baseline.
+"""
+
+import argparse
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import time
+
+from espresso_func import VARIANTS
+
+# name -> (isOptimal, board size) of the tableGen outputs
+CHESS_TABLES = {
+    '3x3-dict': (True, 3),
+    '4x4-dict': (True, 4),
+    '4x4-strategy': (False, 4),
+}
+
+METHODS = ('merge-fast', 'merge-best', 'espresso')
+
+PARSER = argparse.ArgumentParser(description=__doc__)
+PARSER.add_argument(
+    '--tables', nargs='+', default=['3x3-dict', '4x4-strategy'],
+    help=("tables to run: " + ", ".join(CHESS_TABLES) +
+          ", or synthetic-N for a generated table with N input bits")
+)
+PARSER.add_argument(
+    '--rows', nargs='+', type=int, default=[0],
+    help="row counts to cut the tables to, 0 for the whole table"
+)
+PARSER.add_argument('--methods', nargs='+', choices=METHODS, default=list(METHODS))
+PARSER.add_argument(
+    '--backends', nargs='+', choices=['python', 'numpy'], default=['python'],
+    help="mergeFormulas backends"
+)
+PARSER.add_argument(
+    '--flags', nargs='+', choices=list(VARIANTS), default=['default'],
+    help="espresso option sets"
+)
+PARSER.add_argument('--warmup', type=int, default=1)
+PARSER.add_argument('--repeat', type=int, default=3)
+PARSER.add_argument('--output', default='bench_output.json', help="JSON results file")
+PARSER.add_argument('--compare', metavar='BASELINE', help="JSON results to compare against")
+PARSER.add_argument(
+    '--tolerance', type=float, default=0.10,
+    help="allowed relative slowdown before a case counts as a regression"
+)
+
+
+def syntheticTable(keyBits, valBits=12, seed=0):
+    # every key gets an output that depends on its first few bits only,
+    # so the table has structure for the minimizers to find
+    rnd = random.Random(seed)
+    selectBits = min(keyBits, 6)
+    outputs = [format(rnd.getrandbits(valBits), f'0{valBits}b') for _ in range(1 << selectBits)]
+    table = {}
+    for key in range(1 << keyBits):
+        if rnd.random() < 0.5:
+            continue
+        table[format(key, f'0{keyBits}b')] = outputs[key >> (keyBits - selectBits)]
+    return table
+
+def loadTable(name):
+    if name.startswith('synthetic-'):
+        return syntheticTable(int(name.split('-', 1)[1]))
+    import main_minimizer
+    isOptimal, boardSize = CHESS_TABLES[name]
+    main_minimizer.goIntoScriptDir()
+    lookup = main_minimizer.readInputFile(isOptimal, boardSize)
+    return main_minimizer.convertToBits(lookup, boardSize)
+
+def caseId(case):
+    parts = [case['table'], f"rows={case['rows'] or 'all'}", case['method']]
+    if case['method'] == 'espresso':
+        parts.append(case['flags'])
+    else:
+        parts.append(case['backend'])
+    return " ".join(parts)
+
+def runOnce(case, table):
+    if case['method'] == 'espresso':
+        from espresso_func import minimize_cover
+        key = next(iter(table))
+        return len(minimize_cover(len(key), len(table[key]), table, VARIANTS[case['flags']]))
+    from main_minimizer import mergeFormulas
+    useFaster = case['method'] == 'merge-fast'
+    return len(mergeFormulas(table, useFaster, backend=case['backend']))
+
+def runCase(case, warmup, repeat):
+    # runs in its own process, so ru_maxrss is the peak of this case only
+    with contextlib.redirect_stdout(io.StringIO()):
+        table = loadTable(case['table'])
+        if case['rows']:
+            table = dict(itertools.islice(table.items(), case['rows']))
+        for _ in range(warmup):
+            runOnce(case, table)
+        seconds = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            cubes = runOnce(case, table)
+            seconds.append(time.perf_counter() - start)
+    return {
+        'id': caseId(case),
+        **case,
+        'table_rows': len(table),
+        'seconds': seconds,
+        'median': statistics.median(seconds),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        'cubes': cubes,
+    }
+
+def cases(opts):
+    for table, rows, method in itertools.product(opts.tables, opts.rows, opts.methods):
+        if method == 'espresso':
+            for flags in opts.flags:
+                yield {'table': table, 'rows': rows, 'method': method, 'flags': flags}
+        else:
+            for backend in opts.backends:
+                yield {'table': table, 'rows': rows, 'method': method, 'backend': backend}
+
+def runAll(opts):
+    results = []
+    ctx = multiprocessing.get_context('spawn')
+    for case in cases(opts):
+        with ctx.Pool(1) as pool:
+            result = pool.apply(runCase, (case, opts.warmup, opts.repeat))
+        print(f"{result['id']}: {result['median']:.3f} s, "
+              f"{result['peak_rss_kb'] / 1024:.1f} MB, {result['cubes']} cubes")
+        results.append(result)
+    return {
+        'python': sys.version.split()[0],
+        'platform': platform.platform(),
+        'created': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'results': results,
+    }
+
+def compare(report, baseline, tolerance):
+    """Print every case next to its baseline and return the regressed ids."""
+    old = {r['id']: r for r in baseline['results']}
+    regressions = []
+    for r in report['results']:
+        b = old.get(r['id'])
+        if b is None:
+            print(f"{r['id']}: no baseline")
+            continue
+        ratio = r['median'] / b['median'] if b['median'] else float('inf')
+        slower = ratio > 1 + tolerance
+        bigger = r['cubes'] > b['cubes']
+        flag = "REGRESSION" if slower or bigger else "ok"
+        print(f"{r['id']}: {b['median']:.3f} -> {r['median']:.3f} s ({ratio:.2f}x), "
+              f"{b['cubes']} -> {r['cubes']} cubes  {flag}")
+        if slower or bigger:
+            regressions.append(r['id'])
+    return regressions
+
+def main(argv=None):
+    opts = PARSER.parse_args(argv)
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    report = runAll(opts)
+    with open(opts.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {opts.output}")
+    if opts.compare:
+        with open(opts.compare) as f:
+            baseline = json.load(f)
+        if compare(report, baseline, opts.tolerance):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
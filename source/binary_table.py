@@ -0,0 +1,111 @@
+# compact binary format for the tableGen outputs.
+# a 32 byte header followed by fixed-width records of packed key and value
+# (as produced by table_loader). the loader memory-maps the records, so a
+# table is usable without parsing text or building dicts
+#
+# header, little-endian:
+#   4s  magic b'KRKT'
+#   H   format version
+#   H   board size
+#   H   key bits
+#   H   value bits
+#   H   bytes per key
+#   H   bytes per value
+#   Q   row count
+#   8x  padding
+import os
+import struct
+import tempfile
+
+import numpy as np
+
+import table_loader
+
+MAGIC = b'KRKT'
+VERSION = 1
+HEADER = struct.Struct('<4sHHHHHHQ8x')
+
+def _fieldBytes(bits):
+    for size in (1, 2, 4, 8):
+        if bits <= 8 * size:
+            return size
+    raise ValueError(f'{bits} bits do not fit in a record field')
+
+def recordDtype(keyBytes, valBytes):
+    return np.dtype([('key', f'<u{keyBytes}'), ('value', f'<u{valBytes}')])
+
+def binaryTableFile(textFile):
+    return os.path.splitext(textFile)[0] + '.bin'
+
+def writeBinaryTable(path, packedKeys, packedValues, boardSize):
+    keyBits = table_loader.keyLen(boardSize)
+    valBits = table_loader.valLen(boardSize)
+    keyBytes = _fieldBytes(keyBits)
+    valBytes = _fieldBytes(valBits)
+    records = np.empty(len(packedKeys), dtype=recordDtype(keyBytes, valBytes))
+    records['key'] = packedKeys
+    records['value'] = packedValues
+    # through a temporary file, so a job converting the same table at the
+    # same time never maps a half written one
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, VERSION, boardSize, keyBits, valBits,
+                                keyBytes, valBytes, len(records)))
+            f.write(records.tobytes())
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+def convertTextTable(textFile, boardSize, path = None):
+    # tableGen text output -> binary table, returns the path written
+    if path is None:
+        path = binaryTableFile(textFile)
+    packedKeys, packedValues = table_loader.loadPackedTable(textFile, boardSize)
+    writeBinaryTable(path, packedKeys, packedValues, boardSize)
+    return path
+
+class BinaryTable:
+    # a memory-mapped binary table. keys and values are read-only arrays
+    # backed by the file
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            raise ValueError(f'{path} is too short for a binary table')
+        magic, version, boardSize, keyBits, valBits, keyBytes, valBytes, rows = HEADER.unpack(header)
+        if magic != MAGIC:
+            raise ValueError(f'{path} is not a binary table')
+        if version != VERSION:
+            raise ValueError(f'{path} has format version {version}, expected {VERSION}')
+        self.path = path
+        self.boardSize = boardSize
+        self.keyBits = keyBits
+        self.valBits = valBits
+        if rows:
+            self.records = np.memmap(path, dtype=recordDtype(keyBytes, valBytes), mode='r',
+                                     offset=HEADER.size, shape=(rows,))
+        else:
+            self.records = np.zeros(0, dtype=recordDtype(keyBytes, valBytes))
+        self.keys = self.records['key']
+        self.values = self.records['value']
+
+    def __len__(self):
+        return len(self.records)
+
+    def toBitLookup(self):
+        # materializes the bitLookup dict, for code that still needs strings
+        return table_loader.toBitLookup(self.keys.astype(np.uint64),
+                                        self.values.astype(np.uint64), self.boardSize)
+
+def openBinaryTable(path):
+    return BinaryTable(path)
+
+def loadOrConvert(textFile, boardSize):
+    # opens the binary table next to textFile, (re)building it when the
+    # text is newer
+    path = binaryTableFile(textFile)
+    if not os.path.exists(path) or os.path.getmtime(path) < os.path.getmtime(textFile):
+        convertTextTable(textFile, boardSize, path)
+    return openBinaryTable(path)
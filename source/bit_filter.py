@@ -0,0 +1,124 @@
+# mask/value predicates for filtering tables by their bits.
+# a pattern like r"0..0........" (what filterTable used to give re.match)
+# is compiled into an integer care mask and value: a row matches when
+# bits & care == value. the first character is the most significant bit
+# and, like re.match, a pattern only has to match a prefix of the row
+import numpy as np
+
+class BitPredicate:
+    # a test on the bits of a row, combined with & and |. subclasses give
+    # test (one packed row) and mask (an array of packed rows)
+    def test(self, bits, width):
+        raise NotImplementedError
+
+    def mask(self, packed, width):
+        raise NotImplementedError
+
+    def __and__(self, other):
+        return AllOf(self, other)
+
+    def __or__(self, other):
+        return AnyOf(self, other)
+
+class BitPattern(BitPredicate):
+    def __init__(self, pattern):
+        bad = set(pattern) - set('01.')
+        if bad:
+            raise ValueError(f"Pattern {pattern!r} may only contain 0, 1 and '.', got {sorted(bad)}")
+        self.pattern = pattern
+        self._compiled = {}
+
+    def masks(self, width):
+        # (care, value) for rows of the given width, None when the pattern
+        # is longer than the row and so can never match
+        if width not in self._compiled:
+            if len(self.pattern) > width:
+                self._compiled[width] = None
+            else:
+                care = 0
+                value = 0
+                for i, c in enumerate(self.pattern):
+                    if c == '.':
+                        continue
+                    bit = 1 << (width - 1 - i)
+                    care |= bit
+                    if c == '1':
+                        value |= bit
+                self._compiled[width] = (care, value)
+        return self._compiled[width]
+
+    def test(self, bits, width):
+        masks = self.masks(width)
+        return masks is not None and bits & masks[0] == masks[1]
+
+    def mask(self, packed, width):
+        # boolean array over an array of packed rows
+        packed = np.asarray(packed)
+        masks = self.masks(width)
+        if masks is None:
+            return np.zeros(packed.shape, dtype=bool)
+        care, value = (packed.dtype.type(m) for m in masks)
+        return (packed & care) == value
+
+    def __repr__(self):
+        return f"BitPattern({self.pattern!r})"
+
+class AllOf(BitPredicate):
+    def __init__(self, *patterns):
+        self.patterns = [compilePattern(p) for p in patterns]
+
+    def test(self, bits, width):
+        return all(p.test(bits, width) for p in self.patterns)
+
+    def mask(self, packed, width):
+        result = np.ones(np.shape(packed), dtype=bool)
+        for p in self.patterns:
+            result &= p.mask(packed, width)
+        return result
+
+    def __repr__(self):
+        return "AllOf(" + ", ".join(map(repr, self.patterns)) + ")"
+
+class AnyOf(BitPredicate):
+    def __init__(self, *patterns):
+        self.patterns = [compilePattern(p) for p in patterns]
+
+    def test(self, bits, width):
+        return any(p.test(bits, width) for p in self.patterns)
+
+    def mask(self, packed, width):
+        result = np.zeros(np.shape(packed), dtype=bool)
+        for p in self.patterns:
+            result |= p.mask(packed, width)
+        return result
+
+    def __repr__(self):
+        return "AnyOf(" + ", ".join(map(repr, self.patterns)) + ")"
+
+def compilePattern(pattern):
+    if pattern is None or isinstance(pattern, BitPredicate):
+        return pattern
+    return BitPattern(pattern)
+
+def selectMask(keys, values, keyWidth, valWidth, byKey = None, byValue = None):
+    # boolean array of the rows of packed keys/values passing both filters
+    result = np.ones(np.shape(keys), dtype=bool)
+    byKey = compilePattern(byKey)
+    byValue = compilePattern(byValue)
+    if byKey is not None:
+        result &= byKey.mask(keys, keyWidth)
+    if byValue is not None:
+        result &= byValue.mask(values, valWidth)
+    return result
+
+def iterSelected(table, byKey = None, byValue = None):
+    # lazily yields the (key, value) items of a dict of bit strings that
+    # pass both filters, without copying the table
+    byKey = compilePattern(byKey)
+    byValue = compilePattern(byValue)
+    for k, v in table.items():
+        if byKey is not None and not byKey.test(int(k, 2), len(k)):
+            continue
+        if byValue is not None and not byValue.test(int(v, 2), len(v)):
+            continue
+        yield k, v
@@ -0,0 +1,93 @@
+# budgets and checkpoints for main_minimizer.runMerging.
+# every iteration leaves tableList a valid cover, so the loop can stop
+# whenever a MergeBudget runs out and return what it has, and a Checkpoint
+# can save it and pick it up again after a crash
+import gzip
+import os
+import pickle
+import tempfile
+import time
+
+CHECKPOINT_VERSION = 1
+
+class MergeBudget:
+    # stops the merging after `seconds` of wall clock or `iterations`
+    # iterations of this run, whichever comes first. exhausted tells
+    # whether the last run was cut short
+    def __init__(self, seconds = None, iterations = None):
+        self.seconds = seconds
+        self.iterations = iterations
+        self.startTime = None
+        self.exhausted = False
+
+    def start(self):
+        self.startTime = time.perf_counter()
+        self.exhausted = False
+
+    def timeLeft(self):
+        if self.seconds is None:
+            return None
+        return self.seconds - (time.perf_counter() - self.startTime)
+
+    def check(self, iterations):
+        # called after every iteration with the iterations done so far
+        if self.iterations is not None and iterations >= self.iterations:
+            self.exhausted = True
+        elif self.seconds is not None and self.timeLeft() <= 0:
+            self.exhausted = True
+        return self.exhausted
+
+class Checkpoint:
+    # tableList saved as Formula.toTuple() in a gzipped pickle, together
+    # with the key of the table and options it belongs to. saves at most
+    # every `every` seconds, always through a temporary file and a rename
+    def __init__(self, path, key, every = 60.0):
+        self.path = path
+        self.key = key
+        self.every = every
+        self.lastSave = time.perf_counter()
+
+    def load(self):
+        # (iteration, formula tuples, done), or None without a checkpoint
+        try:
+            with gzip.open(self.path, "rb") as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        if data.get('version') != CHECKPOINT_VERSION:
+            raise ValueError(f"{self.path} has checkpoint version {data.get('version')}, "
+                             f"expected {CHECKPOINT_VERSION}")
+        if data['key'] != self.key:
+            raise ValueError(f"{self.path} is a checkpoint of another table or strategy")
+        return data['iteration'], data['formulas'], data['done']
+
+    def save(self, iteration, tableList, done = False):
+        data = {
+            'version': CHECKPOINT_VERSION,
+            'key': self.key,
+            'iteration': iteration,
+            'done': done,
+            'formulas': [f.toTuple() for f in tableList],
+        }
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as raw, gzip.GzipFile(fileobj=raw, mode="wb") as f:
+                pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.lastSave = time.perf_counter()
+
+    def maybeSave(self, iteration, tableList):
+        if time.perf_counter() - self.lastSave >= self.every:
+            self.save(iteration, tableList)
+            return True
+        return False
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,162 @@
+"""\
+Shannon-cofactor minimization of large PLAs.
+
+The cover is split on a few input bits (e.g. the BKx/BKy bits), every
+cofactor is minimized on the remaining inputs in its own worker process,
+and the cubes are put back together with a cheap merge and irredundancy
+pass at the end.
+"""
+
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from espresso_func import minimize_cover, string_cover
+
+
+def leading_bits(depth):
+    return list(range(depth))
+
+def cofactor(pairs, split_bits):
+    """Group (input, output) rows by their values on split_bits.
+
+    Returns a dict mapping the split values to the rows of that cofactor,
+    with the split positions removed from the inputs. Rows with a '-' on a
+    split bit go into every cofactor they cover.
+    """
+    split = set(split_bits)
+    keep = [i for i in range(len(pairs[0][0])) if i not in split] if pairs else []
+    parts = {}
+    for invec, outvec in pairs:
+        rest = "".join(invec[i] for i in keep)
+        prefixes = [""]
+        for i in split_bits:
+            chars = "01" if invec[i] == '-' else invec[i]
+            prefixes = [p + c for p in prefixes for c in chars]
+        for prefix in prefixes:
+            parts.setdefault(prefix, []).append((rest, outvec))
+    return parts
+
+def _expand(prefix, rest, split_bits, ninputs):
+    chars = []
+    it = iter(rest)
+    split = dict(zip(split_bits, prefix))
+    for i in range(ninputs):
+        chars.append(split[i] if i in split else next(it))
+    return "".join(chars)
+
+def _minimize_part(job):
+    ninputs, noutputs, rows, config, intype = job
+    if not any('1' in outvec for _, outvec in rows):
+        return []
+    return minimize_cover(ninputs, noutputs, rows, config, intype)
+
+def merge_cubes(cubes, split_bits):
+    """Merge cubes that only differ in one split bit or only in their outputs."""
+    byInput = {}
+    for invec, outvec in cubes:
+        old = byInput.get(invec)
+        if old is not None:
+            outvec = "".join('1' if '1' in (a, b) else '0' for a, b in zip(old, outvec))
+        byInput[invec] = outvec
+    cubes = set(byInput.items())
+
+    changed = True
+    while changed:
+        changed = False
+        for i in split_bits:
+            pending = {}
+            merged = set()
+            for invec, outvec in cubes:
+                if invec[i] == '-':
+                    merged.add((invec, outvec))
+                    continue
+                key = (invec[:i] + '-' + invec[i + 1:], outvec)
+                if key in pending:
+                    merged.add(key)
+                    del pending[key]
+                    changed = True
+                else:
+                    pending[key] = (invec, outvec)
+            merged.update(pending.values())
+            cubes = merged
+    return sorted(cubes)
+
+def remove_redundant(cubes, pairs):
+    """Drop cubes whose specified ON outputs are all covered by other cubes.
+
+    Only checks the rows of the original cover, which is enough for a
+    cover made of minterms. Covers whose rows contain '-' are returned
+    unchanged.
+    """
+    if not cubes or any('-' in invec for invec, _ in pairs):
+        return cubes
+    keys = np.array([int(invec, 2) for invec, _ in pairs], dtype=np.uint64)
+    onset = np.array([[c == '1' for c in outvec] for _, outvec in pairs], dtype=bool)
+    onset = onset.reshape(len(pairs), len(cubes[0][1]))
+    masks = [int(invec.replace('0', '1').replace('-', '0'), 2) for invec, _ in cubes]
+    values = [int(invec.replace('-', '0'), 2) for invec, _ in cubes]
+    outputs = np.array([[c == '1' for c in outvec] for _, outvec in cubes], dtype=bool)
+
+    covered = []
+    counts = np.zeros(onset.shape, dtype=np.int32)
+    for mask, value, outvec in zip(masks, values, outputs):
+        rows = np.flatnonzero((keys & np.uint64(mask)) == np.uint64(value))
+        contribution = onset[rows] & outvec
+        counts[rows] += contribution
+        covered.append((rows, contribution))
+
+    # try the cubes that cover the least first
+    order = sorted(range(len(cubes)), key=lambda c: int(covered[c][1].sum()))
+    keep = [True] * len(cubes)
+    for c in order:
+        rows, contribution = covered[c]
+        if np.all(counts[rows][contribution] >= 2):
+            counts[rows] -= contribution
+            keep[c] = False
+    return [cube for cube, kept in zip(cubes, keep) if kept]
+
+def minimize_partitioned(ninputs, noutputs, cover, split_bits, config=None,
+                         intype=None, workers=None):
+    """Minimize a cover by cofactoring it on split_bits.
+
+    Every cofactor is minimized independently in a process pool and the
+    cubes are reassembled, merged across the split bits and made
+    irredundant against the rows of the cover.
+    """
+    pairs = string_cover(cover)
+    split_bits = sorted(split_bits)
+    if not split_bits:
+        return minimize_cover(ninputs, noutputs, pairs, config, intype)
+    parts = cofactor(pairs, split_bits)
+    prefixes = sorted(parts)
+    rest = ninputs - len(split_bits)
+    jobs = [(rest, noutputs, parts[p], config, intype) for p in prefixes]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_minimize_part, jobs))
+
+    cubes = []
+    for prefix, part in zip(prefixes, results):
+        for invec, outvec in part:
+            cubes.append((_expand(prefix, invec, split_bits, ninputs), outvec))
+    cubes = merge_cubes(cubes, split_bits)
+    return remove_redundant(cubes, pairs)
+
+def sweep_split_depth(ninputs, noutputs, cover, depths, config=None,
+                      intype=None, workers=None):
+    """Run minimize_partitioned for several split depths and report each.
+
+    Depth d splits on the first d inputs, depth 0 is a plain espresso run.
+    Returns a list of {'depth', 'cubes', 'seconds'} dicts.
+    """
+    pairs = string_cover(cover)
+    report = []
+    for depth in depths:
+        start = time.time()
+        cubes = minimize_partitioned(ninputs, noutputs, pairs, leading_bits(depth),
+                                     config, intype, workers)
+        seconds = time.time() - start
+        report.append({'depth': depth, 'cubes': len(cubes), 'seconds': seconds})
+        print(f"depth {depth}: {len(cubes)} cubes in {seconds:.2f} s")
+    return report
@@ -0,0 +1,222 @@
+"""\
+Evaluation of minimized covers.
+
+A cube such as ('1-0', '010') is turned into integer masks: the input
+matches when key & mask == value, and then the cube sets the bits of
+its output. Keys and outputs are read as binary numbers, so the first
+character of a string is the most significant bit.
+"""
+
+import numpy as np
+
+from pla_io import cube_symbols, pack_cubes, read_pla
+
+
+def cube_masks(cubes):
+    """Return (mask, value, output) uint64 arrays for a list of cubes."""
+    packed = pack_cubes(cubes)
+    return packed.in_mask, packed.in_value, packed.out_value
+
+def table_arrays(table):
+    """Return (keys, values) uint64 arrays of a dict of bit strings."""
+    keys = np.fromiter((int(k, 2) for k in table), dtype=np.uint64, count=len(table))
+    values = np.fromiter((int(v, 2) for v in table.values()), dtype=np.uint64,
+                         count=len(table))
+    return keys, values
+
+def evaluate_cover(cubes, keys):
+    """OR of the outputs of every cube matching each key."""
+    return CompiledCover(cubes, dense_inputs=0).evaluate(keys)
+
+# queries evaluated at once by CompiledCover.evaluate, bounds the
+# (queries, cube words) match matrix
+DEFAULT_CHUNK_ROWS = 1 << 16
+# input bits looked up together in one table by CompiledCover.evaluate
+GROUP_BITS = 8
+# covers with at most this many inputs also get their whole truth table
+# (8 MB at 20 inputs, the 8x8 keys have 18)
+DENSE_INPUTS = 20
+
+def _pack_cubes(flags):
+    """Pack a (cubes, n) bool array into (n, words) uint64 cube bitsets.
+
+    Bit c % 64 of word c // 64 of row j is flags[c, j].
+    """
+    ncubes, ncols = flags.shape
+    nwords = max(1, (ncubes + 63) // 64)
+    padded = np.zeros((nwords * 64, ncols), dtype=bool)
+    padded[:ncubes] = flags
+    packed = np.packbits(padded, axis=0, bitorder='little')
+    return np.ascontiguousarray(packed.T).view('<u8')
+
+class CompiledCover:
+    """A cover compiled into bitsets over its cubes.
+
+    The inputs are cut into groups of GROUP_BITS bits, and for every value
+    of a group a table holds the set of cubes accepting it, 64 cubes per
+    word. evaluate ANDs the sets picked by the groups of each key, which
+    leaves the cubes matching it, then ORs the outputs of those cubes
+    eight at a time from per-byte tables. Every step works on a whole
+    chunk of keys. query answers one key at a time from an index on the
+    most selective input bits.
+
+    A cover with at most dense_inputs inputs is evaluated once on every
+    key, after which both evaluate and query are a table lookup.
+    """
+
+    def __init__(self, cubes, index_bits=8, dense_inputs=DENSE_INPUTS):
+        self.cubes = list(cubes)
+        self.ninputs = len(self.cubes[0][0]) if self.cubes else 0
+        self.noutputs = len(self.cubes[0][1]) if self.cubes else 0
+        self.masks, self.values, self.outputs = cube_masks(self.cubes)
+        chars = cube_symbols(self.cubes)[0]
+        accept = (_pack_cubes(chars != ord('1')), _pack_cubes(chars != ord('0')))
+        nwords = accept[0].shape[1]
+
+        # (shift, table): the group is (key >> shift) & (len(table) - 1)
+        self.groups = []
+        for first in range(0, self.ninputs, GROUP_BITS):
+            width = min(GROUP_BITS, self.ninputs - first)
+            table = np.full((1 << width, nwords), ~np.uint64(0))
+            for v in range(1 << width):
+                for b in range(width):
+                    table[v] &= accept[(v >> (width - 1 - b)) & 1][first + b]
+            self.groups.append((np.uint64(self.ninputs - first - width), table))
+
+        # byte b of the match words -> OR of the outputs of its cubes
+        outputs = np.zeros(nwords * 64, dtype=np.uint64)
+        outputs[:len(self.cubes)] = self.outputs
+        bits = (np.arange(256)[:, None] >> np.arange(8)[None, :]) & 1
+        self.byte_outputs = np.zeros((nwords * 8, 256), dtype=np.uint64)
+        for b in range(nwords * 8):
+            for c in range(8):
+                self.byte_outputs[b][bits[:, c] == 1] |= outputs[b * 8 + c]
+
+        self.index_bits = index_bits
+        self._index = None
+        self.dense = None
+        self._dense_list = None
+        if self.cubes and self.ninputs <= dense_inputs:
+            self.dense = self._evaluate_bitsets(np.arange(1 << self.ninputs, dtype=np.uint64))
+            self._dense_list = self.dense.tolist()
+
+    @classmethod
+    def from_pla(cls, path, index_bits=8, dense_inputs=DENSE_INPUTS):
+        return cls(load_cover(path), index_bits, dense_inputs)
+
+    def evaluate(self, keys, chunk_rows=None):
+        """OR of the outputs of every cube matching each key."""
+        keys = np.asarray(keys, dtype=np.uint64)
+        if self.dense is not None:
+            return self.dense[keys & np.uint64(len(self.dense) - 1)]
+        return self._evaluate_bitsets(keys, chunk_rows)
+
+    def _evaluate_bitsets(self, keys, chunk_rows=None):
+        flat = keys.ravel()
+        result = np.zeros(flat.shape, dtype=np.uint64)
+        if not self.cubes:
+            return result.reshape(keys.shape)
+        step = chunk_rows or DEFAULT_CHUNK_ROWS
+        for start in range(0, len(flat), step):
+            chunk = flat[start:start + step]
+            match = None
+            for shift, table in self.groups:
+                rows = table[(chunk >> shift) & np.uint64(len(table) - 1)]
+                match = rows if match is None else match & rows
+            matchBytes = match.view(np.uint8)
+            out = result[start:start + step]
+            for b, table in enumerate(self.byte_outputs):
+                out |= table[matchBytes[:, b]]
+        return result.reshape(keys.shape)
+
+    def _selective_bits(self):
+        # input positions specified by the most cubes, most significant first
+        chars = cube_symbols(self.cubes)[0]
+        counts = (chars != ord('-')).sum(axis=0)
+        order = sorted(range(self.ninputs), key=lambda i: (-counts[i], i))
+        return sorted(order[:min(self.index_bits, self.ninputs)])
+
+    def _pattern(self, key):
+        pattern = 0
+        for shift in self._shifts:
+            pattern = (pattern << 1) | ((key >> shift) & 1)
+        return pattern
+
+    def _build_index(self):
+        positions = self._selective_bits()
+        self._shifts = [self.ninputs - 1 - i for i in positions]
+        index = {}
+        for c, (invec, _) in enumerate(self.cubes):
+            patterns = [0]
+            for i in positions:
+                bits = (0, 1) if invec[i] == '-' else (int(invec[i]),)
+                patterns = [(p << 1) | b for p in patterns for b in bits]
+            entry = (int(self.masks[c]), int(self.values[c]), int(self.outputs[c]))
+            for p in patterns:
+                index.setdefault(p, []).append(entry)
+        self._index = index
+
+    def query(self, key):
+        """Output of a single packed key, as an int."""
+        if self._dense_list is not None:
+            return self._dense_list[key & (len(self._dense_list) - 1)]
+        if self._index is None:
+            self._build_index()
+        result = 0
+        for mask, value, output in self._index.get(self._pattern(key), ()):
+            if key & mask == value:
+                result |= output
+        return result
+
+def load_cover(path):
+    """Cubes of a PLA file such as minimized4x4.pla."""
+    return read_pla(path)['cover']
+
+def _time_cover(compiled, keys, values, batch, single):
+    import time
+
+    report = {'mismatches': int(np.count_nonzero(compiled.evaluate(keys) != values))}
+    start = time.perf_counter()
+    for k in single:
+        compiled.query(k)
+    report['query_latency'] = (time.perf_counter() - start) / len(single)
+    start = time.perf_counter()
+    compiled.evaluate(batch)
+    report['batch_throughput'] = len(batch) / (time.perf_counter() - start)
+    return report
+
+def benchmark_lookup(cover, table, queries=1000000, single_queries=100000, seed=0):
+    """Time the compiled cover against a plain dict lookup into table.
+
+    table is a dict of bit strings like main_minimizer.bitLookup, the
+    queries are drawn from its keys. The cover is timed with its bitsets
+    and index and, when small enough, with its truth table. Prints and
+    returns, per mode, the mismatches against the table, the latency of
+    single queries and the throughput of the batch evaluation.
+    """
+    import time
+
+    cubes = cover.cubes if isinstance(cover, CompiledCover) else cover
+    keys, values = table_arrays(table)
+    rng = np.random.default_rng(seed)
+    batch = keys[rng.integers(0, len(keys), queries)]
+    single = batch[:single_queries].tolist()
+    strings = [format(k, f'0{len(next(iter(table)))}b') for k in single]
+
+    start = time.perf_counter()
+    for k in strings:
+        table[k]
+    latency = (time.perf_counter() - start) / len(strings)
+    report = {'dict': {'query_latency': latency, 'batch_throughput': 1 / latency}}
+    report['bitsets'] = _time_cover(CompiledCover(cubes, dense_inputs=0),
+                                    keys, values, batch, single)
+    compiled = CompiledCover(cubes)
+    if compiled.dense is not None:
+        report['truth table'] = _time_cover(compiled, keys, values, batch, single)
+
+    print(f"{len(cubes)} cubes, {len(table)} table rows, {queries} queries")
+    print(f"{'mode':12} {'mismatches':>10} {'ns/query':>9} {'M queries/s':>12}")
+    for mode, r in report.items():
+        print(f"{mode:12} {r.get('mismatches', 0):10d} {r['query_latency'] * 1e9:9.0f} "
+              f"{r['batch_throughput'] / 1e6:12.2f}")
+    return report
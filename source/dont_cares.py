@@ -0,0 +1,107 @@
+# don't-care set of the keys that are no position at all: two pieces on the
+# same square, kings next to each other, and coordinates >= boardSize when
+# posBitLen bits can code more columns than the board has (3x3 on 2 bits).
+# the set comes out as a short list of input cubes over the key bits of
+# table_loader, not as enumerated minterms, and is handed to espresso with
+# '-' outputs
+import time
+
+import table_loader
+from cofactor_minimizer import merge_cubes
+
+# field index of every coordinate in the key: BKx, BKy, WKx, WKy, WRx, WRy
+BK, WK, WR = (0, 1), (2, 3), (4, 5)
+
+def _cube(fields, posBits):
+    # fields: {field index: value} -> input cube with every other field '-'
+    chars = ['-'] * (6 * posBits)
+    for field, value in fields.items():
+        chars[field * posBits:(field + 1) * posBits] = format(value, f'0{posBits}b')
+    return "".join(chars)
+
+def outOfBoardCubes(boardSize):
+    posBits = table_loader.posBitLen(boardSize)
+    return [_cube({field: v}, posBits)
+            for field in range(6) for v in range(boardSize, 1 << posBits)]
+
+def sameSquareCubes(boardSize):
+    posBits = table_loader.posBitLen(boardSize)
+    cubes = []
+    for a, b in ((BK, WK), (BK, WR), (WK, WR)):
+        for x in range(boardSize):
+            for y in range(boardSize):
+                cubes.append(_cube({a[0]: x, a[1]: y, b[0]: x, b[1]: y}, posBits))
+    return cubes
+
+def adjacentKingCubes(boardSize):
+    # kings on the same square are left to sameSquareCubes
+    posBits = table_loader.posBitLen(boardSize)
+    near = [(c1, c2) for c1 in range(boardSize) for c2 in range(boardSize) if abs(c1 - c2) <= 1]
+    return [_cube({BK[0]: x1, WK[0]: x2, BK[1]: y1, WK[1]: y2}, posBits)
+            for x1, x2 in near for y1, y2 in near if (x1, y1) != (x2, y2)]
+
+def _contains(big, small):
+    return all(b == '-' or b == s for b, s in zip(big, small))
+
+def compactCubes(cubes):
+    # merges cubes one bit apart until nothing changes, then drops the ones
+    # inside another cube
+    if not cubes:
+        return []
+    ninputs = len(cubes[0])
+    cubes = [invec for invec, _ in merge_cubes([(c, '1') for c in cubes], range(ninputs))]
+    # the most general cubes first, so a cube only has to be checked
+    # against the ones kept before it
+    cubes.sort(key=lambda c: -c.count('-'))
+    kept = []
+    for c in cubes:
+        if not any(_contains(k, c) for k in kept):
+            kept.append(c)
+    return sorted(kept)
+
+def illegalCubes(boardSize):
+    return compactCubes(outOfBoardCubes(boardSize) + sameSquareCubes(boardSize)
+                        + adjacentKingCubes(boardSize))
+
+def tableOverlap(cubes, table):
+    # keys of the table inside one of the cubes, those can't be don't-cares
+    from cover_eval import evaluate_cover
+    keys = list(table)
+    inside = evaluate_cover([(c, '1') for c in cubes], [int(k, 2) for k in keys])
+    return [k for k, hit in zip(keys, inside) if hit]
+
+def dontCareCover(boardSize, table = None):
+    # illegalCubes, checked not to swallow a row of the table
+    cubes = illegalCubes(boardSize)
+    if table is not None:
+        overlap = tableOverlap(cubes, table)
+        if overlap:
+            raise ValueError(f"{len(overlap)} table keys are illegal positions, e.g. {overlap[0]}")
+    return cubes
+
+def compareDontCares(table, boardSize, config = None):
+    # minimizes the ON-set of a bitLookup without and with the don't-care
+    # set and prints the cube counts. with .type f every key not in the
+    # table is OFF, with .type fd the illegal ones are free. the .type fr
+    # cover of tableToPla already leaves every missing key free and is
+    # given for reference
+    from pyeda.boolalg import espresso
+    from espresso_func import minimize_cover
+
+    ninputs = table_loader.keyLen(boardSize)
+    noutputs = table_loader.valLen(boardSize)
+    dcset = dontCareCover(boardSize, table)
+    print(f"{len(dcset)} don't-care cubes")
+    onset = [(k, v) for k, v in table.items() if '1' in v]
+    runs = (('f', onset, espresso.FTYPE, None),
+            ('fd', onset, espresso.FTYPE, dcset),
+            ('fr', table, espresso.FTYPE | espresso.RTYPE, None))
+    report = {}
+    for name, cover, intype, dc in runs:
+        start = time.time()
+        cubes = minimize_cover(ninputs, noutputs, cover, config, intype, dcset=dc)
+        report[name] = {'cubes': len(cubes), 'seconds': time.time() - start}
+        print(f".type {name}: {len(cubes)} cubes in {report[name]['seconds']:.2f} s")
+    delta = report['fd']['cubes'] - report['f']['cubes']
+    print(f"don't-cares: {delta:+d} cubes")
+    return report
@@ -0,0 +1,221 @@
+"""\
+Exhaustive equivalence checking of minimized covers.
+
+The whole 2^n input space is enumerated in blocks, bit-sliced: a block
+of 64 * words minterms is a uint64 array per input variable, bit j of
+the array being that variable in the j-th minterm of the block. A cube
+is then the AND of its literal planes and an output the OR of its cube
+planes, so every minterm of the block is checked by a few array
+operations per cube.
+
+The reference is a cover with the .type semantics of espresso: a
+bitLookup dict (or its rows) as .type fr, where keys missing from the
+table are don't cares, or an ON-set only cover as .type f, where they
+are OFF.
+"""
+
+import string
+
+import numpy as np
+
+from vectorized_pairing import popcount
+
+
+# minterms per block are 64 * BLOCK_WORDS
+BLOCK_WORDS = 1 << 14
+# a minterm's bits inside one word, for the 6 least significant inputs
+WORD_PATTERNS = [np.uint64(sum(1 << j for j in range(64) if (j >> b) & 1)) for b in range(6)]
+ALL_ONES = ~np.uint64(0)
+
+
+class EquivalenceError(ValueError):
+    pass
+
+
+def _pairs(cover):
+    if isinstance(cover, dict):
+        return list(cover.items())
+    from espresso_func import string_cover
+    return string_cover(cover)
+
+def _bits(number, width):
+    return format(int(number), f"0{width}b")
+
+class _Block:
+    """The minterms [64 * first, 64 * (first + words)) as bit planes."""
+
+    def __init__(self, ninputs, first, words):
+        self.ninputs = ninputs
+        self.first = first
+        self.words = words
+        self.ones = np.full(words, ALL_ONES)
+        if ninputs < 6:
+            self.ones &= np.uint64((1 << (1 << ninputs)) - 1)
+        index = np.arange(first, first + words, dtype=np.uint64)
+        self.planes = []
+        for pos in range(ninputs):
+            b = ninputs - 1 - pos
+            if b < 6:
+                plane = np.full(words, WORD_PATTERNS[b])
+            else:
+                plane = np.where((index >> np.uint64(b - 6)) & np.uint64(1), ALL_ONES, np.uint64(0))
+            self.planes.append(plane & self.ones)
+
+    def zeros(self):
+        return np.zeros(self.words, dtype=np.uint64)
+
+    def cube(self, invec):
+        plane = self.ones.copy()
+        for pos, c in enumerate(invec):
+            if c == '1':
+                plane &= self.planes[pos]
+            elif c == '0':
+                plane &= ~self.planes[pos]
+        return plane
+
+    def scatter(self, keys):
+        # plane with the bits of the given minterms set, keys outside the
+        # block are ignored
+        plane = self.zeros()
+        keys = keys[(keys >> np.uint64(6) >= self.first)
+                    & (keys >> np.uint64(6) < self.first + self.words)]
+        np.bitwise_or.at(plane, (keys >> np.uint64(6)).astype(np.int64) - self.first,
+                         np.uint64(1) << (keys & np.uint64(63)))
+        return plane
+
+    def cover(self, pairs, noutputs, symbol='1'):
+        # per output, the plane of the minterms where some row has symbol.
+        # rows without '-' are set directly instead of ANDing planes
+        planes = [self.zeros() for _ in range(noutputs)]
+        minterms = [[] for _ in range(noutputs)]
+        for invec, outvec in pairs:
+            targets = [o for o, c in enumerate(outvec) if c == symbol]
+            if not targets:
+                continue
+            if '-' in invec:
+                plane = self.cube(invec)
+                for o in targets:
+                    planes[o] |= plane
+            else:
+                key = int(invec, 2)
+                for o in targets:
+                    minterms[o].append(key)
+        for o, keys in enumerate(minterms):
+            if keys:
+                planes[o] |= self.scatter(np.array(keys, dtype=np.uint64))
+        return planes
+
+    def minterms(self, plane, limit):
+        # the first limit minterms set in plane
+        found = []
+        for w in np.flatnonzero(plane)[:limit].tolist():
+            word = int(plane[w])
+            while word and len(found) < limit:
+                low = word & -word
+                found.append(64 * (self.first + w) + low.bit_length() - 1)
+                word ^= low
+            if len(found) >= limit:
+                break
+        return found
+
+def _blocks(ninputs, block_words):
+    total = max(1, (1 << ninputs) // 64)
+    step = block_words or BLOCK_WORDS
+    for first in range(0, total, step):
+        yield _Block(ninputs, first, min(step, total - first))
+
+def _check(ninputs, noutputs, produce, reference, offset, block_words, samples):
+    # produce(block) -> output planes of the checked function, reference
+    # rows give the ON-set, and the OFF-set is their '0' rows or, when
+    # offset is False, every minterm in neither the ON-set nor a '-' row
+    report = {'minterms': 1 << ninputs, 'specified': 0, 'mismatches': 0, 'samples': []}
+    for block in _blocks(ninputs, block_words):
+        onset = block.cover(reference, noutputs, '1')
+        if offset:
+            offPlanes = block.cover(reference, noutputs, '0')
+        else:
+            dcset = block.cover(reference, noutputs, '-')
+            offPlanes = [~(p | d) & block.ones for p, d in zip(onset, dcset)]
+        got = produce(block)
+        wrong = block.zeros()
+        specified = block.zeros()
+        for o in range(noutputs):
+            wrong |= (got[o] & offPlanes[o]) | (~got[o] & onset[o])
+            specified |= onset[o] | offPlanes[o]
+        report['specified'] += int(popcount(specified).sum())
+        report['mismatches'] += int(popcount(wrong).sum())
+        missing = samples - len(report['samples'])
+        if missing > 0:
+            report['samples'] += [_bits(m, ninputs) for m in block.minterms(wrong, missing)]
+    return report
+
+def verify_cover(cubes, reference, fr=True, block_words=None, samples=5):
+    """Compare the outputs of cubes with reference on every input.
+
+    reference is a bitLookup dict or a list of (input, output) rows, read
+    as .type fr (fr=True) or as .type f / fd, where '-' outputs are don't
+    cares and everything else is OFF. Returns a dict with the number of
+    minterms enumerated, how many are specified by the reference, how
+    many of those differ, and up to samples of them.
+    """
+    reference = _pairs(reference)
+    cubes = _pairs(cubes)
+    if not reference:
+        raise ValueError("empty reference")
+    ninputs, noutputs = len(reference[0][0]), len(reference[0][1])
+    produce = lambda block: block.cover(cubes, noutputs, '1')
+    return _check(ninputs, noutputs, produce, reference, fr, block_words, samples)
+
+def _formula_plane(block, formula):
+    plane = block.ones.copy()
+    for i in range(formula.care.bit_length()):
+        if (formula.care >> i) & 1:
+            literal = block.planes[i]
+            plane &= literal if (formula.value >> i) & 1 else ~literal
+    for disj in formula.merged:
+        if isinstance(disj[0], str):
+            # "a eq b" / "a xor b" left by Formula.simplify
+            a, op, b = disj[0].split()
+            pa = block.planes[string.ascii_lowercase.index(a.lower())]
+            pb = block.planes[string.ascii_lowercase.index(b.lower())]
+            plane &= ~(pa ^ pb) if op == 'eq' else (pa ^ pb)
+            continue
+        group = block.zeros()
+        for f in disj:
+            group |= _formula_plane(block, f)
+        plane &= group
+    return plane & block.ones
+
+def verify_formulas(formulas, rows, block_words=None, samples=5):
+    """Check that mergeFormulas' formulas describe exactly the given rows.
+
+    rows are the bit strings mergeFormulas was given (or a dict with them
+    as keys). A minterm is a mismatch when it is a row and no formula
+    holds for it, or when it is not a row and some formula does.
+    """
+    rows = list(rows)
+    if not rows:
+        raise ValueError("no rows")
+    ninputs = len(rows[0])
+    reference = [(row, '1') for row in rows]
+
+    def produce(block):
+        plane = block.zeros()
+        for f in formulas:
+            plane |= _formula_plane(block, f)
+        return [plane]
+
+    return _check(ninputs, 1, produce, reference, False, block_words, samples)
+
+def _raise_on(report, what):
+    if report['mismatches']:
+        raise EquivalenceError(f"{what}: {report['mismatches']} of {report['specified']} "
+                               f"specified minterms differ, e.g. {report['samples']}")
+
+def check_cover(cubes, reference, fr=True):
+    """Raise EquivalenceError unless cubes agree with reference everywhere."""
+    _raise_on(verify_cover(cubes, reference, fr), "cover")
+
+def check_formulas(formulas, rows):
+    """Raise EquivalenceError unless formulas describe exactly rows."""
+    _raise_on(verify_formulas(formulas, rows), "formulas")
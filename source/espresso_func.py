@@ -4,9 +4,12 @@ Minimize a PLA file
 
 import argparse
 import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
 
-from pyeda.boolalg import espresso
-from pyeda.parsing import pla
+import pla_io
+from pla_io import cube_strings, cube_symbols, decode_pyeda, encode_pyeda
+from result_cache import cache_key
 
 
 PARSER = argparse.ArgumentParser(description=__doc__)
@@ -53,53 +56,260 @@ PARSER.add_argument(
           "but occasionally provides better results")
 )
 
+PARSER.add_argument(
+    '--per-output', action='store_true',
+    help=("minimize every output as its own single-output function in a "
+          "process pool and merge identical input cubes afterwards")
+)
+PARSER.add_argument(
+    '--jobs', type=int, default=None,
+    help="number of worker processes for --per-output (default: CPU count)"
+)
+PARSER.add_argument(
+    '--compare', action='store_true',
+    help="run both the monolithic and the per-output mode and report cube counts"
+)
+
+PARSER.add_argument(
+    '--no-verify', action='store_false', dest='verify',
+    help="skip the exhaustive check of the minimized cover against the input"
+)
+
 PARSER.add_argument('file', nargs='?', type=argparse.FileType('r'),
                     default=sys.stdin, help="PLA file (default: stdin)")
 
-def main(fin, fout):
-    opts = PARSER.parse_args()
+# espresso options, named as the argparse destinations above
+DEFAULT_CONFIG = {
+    'fast': False,
+    'ess': True,
+    'irr': True,
+    'unwrap': True,
+    'onset': False,
+    'strong': False,
+}
 
+# named option sets over DEFAULT_CONFIG, named like the command line flags
+VARIANTS = {
+    'default': {},
+    'fast': {'fast': True},
+    'strong': {'strong': True},
+    'onset': {'onset': True},
+    'no-ess': {'ess': False},
+    'no-irr': {'irr': False},
+    'no-unwrap': {'unwrap': False},
+}
+
+def string_cover(cover):
+    """Return the cover as a list of (input, output) strings."""
+    if isinstance(cover, dict):
+        return list(cover.items())
+    pairs = list(cover)
+    if all(isinstance(invec, str) and isinstance(outvec, str) for invec, outvec in pairs):
+        return pairs
+    return cube_strings(*decode_pyeda(pairs))
+
+def config_from_args(opts):
+    return {key: getattr(opts, key) for key in DEFAULT_CONFIG}
+
+def full_config(config=None):
+    cfg = dict(DEFAULT_CONFIG)
+    if config:
+        unknown = set(config) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise ValueError("unknown espresso options: " + ", ".join(sorted(unknown)))
+        cfg.update(config)
+    return cfg
+
+def set_config(config=None):
+    from pyeda.boolalg import espresso
+
+    cfg = full_config(config)
     espresso.set_config(
-        single_expand=opts.fast,
-        remove_essential=opts.ess,
-        force_irredundant=opts.irr,
-        unwrap_onset=opts.unwrap,
-        recompute_onset=opts.onset,
-        use_super_gasp=opts.strong,
+        single_expand=cfg['fast'],
+        remove_essential=cfg['ess'],
+        force_irredundant=cfg['irr'],
+        unwrap_onset=cfg['unwrap'],
+        recompute_onset=cfg['onset'],
+        use_super_gasp=cfg['strong'],
     )
 
+def encode_cover(cover):
+    """Convert a cover into pyeda's tuple encoding.
+
+    The cover is either a dict mapping input strings to output strings
+    (like main_minimizer.bitLookup) or an iterable of (input, output) pairs,
+    given as strings or already as pyeda tuples.
+    """
+    return encode_pyeda(*cube_symbols(string_cover(cover)))
+
+def decode_cover(cover):
+    """Convert a pyeda cover into a sorted list of (input, output) strings."""
+    return sorted(cube_strings(*decode_pyeda(cover)))
+
+def add_dcset(cover, dcset, noutputs, intype):
+    """Append don't-care input cubes to a cover.
+
+    The cubes get '-' on every output. A .type f cover becomes .type fd;
+    with an OFF-set (.type fr) a '-' output already means don't care.
+    Returns the new cover and type.
+    """
+    from pyeda.boolalg import espresso
+
+    cover = string_cover(cover) + [(invec, '-' * noutputs) for invec in dcset]
+    if not intype & espresso.RTYPE:
+        intype |= espresso.DTYPE
+    return cover, intype
+
+def minimize_cover(ninputs, noutputs, cover, config=None, intype=None,
+                   cache=None, dcset=None):
+    """Minimize a cover in memory and return its cubes.
+
+    The cover is taken as described in encode_cover. By default rows are
+    read as the ON-set and OFF-set (.type fr), which is what tableToPla
+    writes and what a bitLookup table means. This default is only for
+    in-memory covers: PLA files without a .type line are read as .type
+    fd, see file_intype. The result is a list of (input, output) strings such as
+    ('1--0', '0100'). dcset is an optional list of input cubes that are
+    don't cares on every output, see add_dcset. With a
+    result_cache.ResultCache, a cover already minimized with the same
+    options is returned from the cache.
+    """
+    from pyeda.boolalg import espresso
+
+    if intype is None:
+        intype = espresso.FTYPE | espresso.RTYPE
+    if dcset:
+        cover, intype = add_dcset(cover, dcset, noutputs, intype)
+    if cache is not None:
+        cover = string_cover(cover)
+        options = dict(full_config(config), ninputs=ninputs,
+                       noutputs=noutputs, intype=intype)
+        key = cache_key("espresso", (f"{i} {o}" for i, o in cover), options)
+        cubes = cache.get(key)
+        if cubes is not None:
+            return cubes
+    set_config(config)
+    result = espresso.espresso(ninputs, noutputs, encode_cover(cover),
+                               intype=intype)
+    cubes = decode_cover(result)
+    if cache is not None:
+        cache.put(key, cubes)
+    return cubes
+
+def _minimize_output(job):
+    ninputs, rows, config, intype = job
+    if not any(outvec == '1' for _, outvec in rows):
+        return []
+    return minimize_cover(ninputs, 1, rows, config, intype)
+
+def minimize_per_output(ninputs, noutputs, cover, config=None, intype=None,
+                        workers=None):
+    """Minimize every output separately and recombine the covers.
+
+    Each output column becomes a single-output function that is minimized
+    in its own worker process. Input cubes found for several outputs are
+    merged into one multi-output cube.
+    """
+    pairs = string_cover(cover)
+    jobs = []
+    for k in range(noutputs):
+        # '-' rows stay don't cares of the output, dropping them would
+        # make them OFF under .type fd
+        rows = [(invec, outvec[k]) for invec, outvec in pairs]
+        jobs.append((ninputs, rows, config, intype))
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        results = list(pool.map(_minimize_output, jobs))
+
+    merged = {}
+    for k, cubes in enumerate(results):
+        for invec, _ in cubes:
+            merged.setdefault(invec, ['0'] * noutputs)[k] = '1'
+    return sorted((invec, "".join(outvec)) for invec, outvec in merged.items())
+
+def compare_per_output(ninputs, noutputs, cover, config=None, intype=None,
+                       workers=None):
+    """Run the monolithic and the per-output minimization on the same cover.
+
+    Prints and returns the cube count and time of both, so the cheaper mode
+    can be picked for a given table.
+    """
+    report = {}
+    for mode, func in (('monolithic', minimize_cover),
+                       ('per-output', minimize_per_output)):
+        kwargs = {'workers': workers} if func is minimize_per_output else {}
+        start = time.time()
+        cubes = func(ninputs, noutputs, cover, config, intype, **kwargs)
+        report[mode] = {'cubes': len(cubes), 'seconds': time.time() - start}
+        print(f"{mode}: {len(cubes)} cubes in {report[mode]['seconds']:.2f} s")
+    delta = report['per-output']['cubes'] - report['monolithic']['cubes']
+    print(f"per-output - monolithic = {delta:+d} cubes")
+    return report
+
+def read_pla(fin):
+    """Parse a PLA file, see pla_io.read_pla."""
+    return pla_io.read_pla(fin)
+
+def write_pla(fout, ninputs, noutputs, cubes,
+              input_labels=None, output_labels=None, intype=None):
+    """Write cubes as a PLA file, see pla_io.write_pla."""
+    pla_io.write_pla(fout, ninputs, noutputs, cubes, input_labels, output_labels,
+                     intype)
+
+def file_intype(d):
+    """The cover type of a parsed PLA file.
+
+    Without a .type line, espresso reads a file as .type fd: rows are the
+    ON-set, '-' outputs don't cares and everything else is OFF.
+    """
+    from pyeda.boolalg import espresso
+
+    return d['intype'] or (espresso.FTYPE | espresso.DTYPE)
+
+def minimize_file(fin, fout, config=None, per_output=False, workers=None,
+                  cache=None, verify=True):
+    from pyeda.boolalg import espresso
+    from equivalence import EquivalenceError, check_cover
+
     try:
-        f = open(fin, "r")
-        d = pla.parse(f.read())
-        f.close()
-    except pla.Error as exc:
-        print("error parsing file:", opts.file.name)
+        d = read_pla(fin)
+    except pla_io.PlaError as exc:
+        print("error parsing file:", fin)
         print(exc)
         return 1
 
+    intype = file_intype(d)
     try:
-        cover = espresso.espresso(d['ninputs'], d['noutputs'],
-                                  d['cover'], intype=d['intype'])
+        func = minimize_per_output if per_output else minimize_cover
+        kwargs = {'workers': workers} if per_output else {'cache': cache}
+        cubes = func(d['ninputs'], d['noutputs'], d['cover'],
+                     config=config, intype=intype, **kwargs)
     except espresso.Error as exc:
         print("espresso failed:", exc)
         return 1
 
-    f = open(fout, "w")
-    print(".i", d['ninputs'], file=f)
-    print(".o", d['noutputs'], file=f)
-    if d['input_labels']:
-        print(".ilb", " ".join(d['input_labels']), file=f)
-    if d['output_labels']:
-        print(".ob", " ".join(d['output_labels']), file=f)
-    print(".p", len(cover), file=f)
-    for invec, outvec in cover:
-        print("".join({1: '0', 2: '1', 3: '-'}[n] for n in invec),
-              "".join({0: '0', 1: '1', 2: '-'}[n] for n in outvec), file=f)
-    print(".e", file=f)
-    f.close()
-    return 0
+    if verify:
+        try:
+            check_cover(cubes, string_cover(d['cover']),
+                        fr=bool(intype & espresso.RTYPE))
+        except EquivalenceError as exc:
+            print("minimized cover differs from", fin)
+            print(exc)
+            return 1
 
-def minimize(inputFile, outputFile):
-    main(inputFile, outputFile)
+    write_pla(fout, d['ninputs'], d['noutputs'], cubes,
+              d['input_labels'], d['output_labels'])
+    return 0
 
+def main(fin, fout, argv=None):
+    opts = PARSER.parse_args(argv)
+    config = config_from_args(opts)
+    if opts.compare:
+        d = read_pla(fin)
+        compare_per_output(d['ninputs'], d['noutputs'], d['cover'], config,
+                           file_intype(d), opts.jobs)
+    return minimize_file(fin, fout, config, opts.per_output, opts.jobs,
+                         verify=opts.verify)
 
+def minimize(inputFile, outputFile, config=None, cache=None):
+    return minimize_file(inputFile, outputFile, config, cache=cache)
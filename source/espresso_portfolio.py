@@ -0,0 +1,204 @@
+"""\
+Race several espresso configurations on the same PLA.
+
+Every variant runs in its own process. A policy picks the winner and
+the processes still running are terminated:
+
+  first     the first variant to finish wins
+  smallest  the fewest cubes among those done by the deadline
+  literals  the fewest literals among those done by the deadline
+
+Timing, size and outcome of every variant are printed and can be
+appended to a JSON lines log, to learn which settings suit a table.
+"""
+
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+from multiprocessing.connection import wait
+
+from espresso_func import (VARIANTS, file_intype, full_config, minimize_cover,
+                           read_pla, string_cover, write_pla)
+from result_cache import cache_key
+
+
+POLICIES = ('first', 'smallest', 'literals')
+
+DEFAULT_LOG = "espresso_portfolio.jsonl"
+
+
+class PortfolioError(RuntimeError):
+    """Every variant failed; errors maps variant names to their error."""
+
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("every espresso variant failed: " +
+                         "; ".join(f"{name}: {error}" for name, error in errors.items()))
+
+
+def cover_literals(cubes):
+    """Literals of a cover: fixed inputs plus the outputs set, per cube."""
+    return sum(len(invec) - invec.count('-') + outvec.count('1')
+               for invec, outvec in cubes)
+
+def _run_variant(conn, ninputs, noutputs, pairs, config, intype):
+    start = time.time()
+    try:
+        cubes = minimize_cover(ninputs, noutputs, pairs, config, intype)
+        conn.send(('done', cubes, time.time() - start))
+    except Exception as exc:
+        conn.send(('failed', f"{type(exc).__name__}: {exc}", time.time() - start))
+    finally:
+        conn.close()
+
+def _score(policy, record):
+    if policy == 'literals':
+        return (record['literals'], record['cubes'], record['seconds'])
+    return (record['cubes'], record['literals'], record['seconds'])
+
+def race(ninputs, noutputs, cover, variants=None, policy='smallest',
+         deadline=None, intype=None, log=None):
+    """Minimize cover with every variant in parallel and keep the best.
+
+    variants maps names to espresso option dicts (VARIANTS by
+    default), deadline is in seconds. Returns (name, cubes, records)
+    where records has one dict per variant with its status ('won',
+    'done', 'failed', 'cancelled' or 'timeout'), cube and literal
+    counts and seconds. With log, the records are appended to that file
+    as JSON lines. Raises TimeoutError when no variant finished before
+    the deadline, and PortfolioError when they all failed.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"unknown policy {policy!r}, expected one of {POLICIES}")
+    variants = VARIANTS if variants is None else variants
+    for config in variants.values():
+        full_config(config)
+    pairs = string_cover(cover)
+
+    records = {}
+    running = {}
+    start = time.time()
+    for name, config in variants.items():
+        records[name] = {'variant': name, 'config': config, 'status': 'cancelled',
+                         'cubes': None, 'literals': None, 'seconds': None}
+        recv, send = multiprocessing.Pipe(duplex=False)
+        proc = multiprocessing.Process(target=_run_variant, daemon=True,
+                                       args=(send, ninputs, noutputs, pairs, config, intype))
+        proc.start()
+        send.close()
+        running[recv] = (name, proc)
+
+    results = {}
+    timedOut = False
+    try:
+        while running:
+            timeout = None
+            if deadline is not None:
+                timeout = max(0.0, deadline - (time.time() - start))
+            ready = wait(list(running), timeout)
+            if not ready:
+                timedOut = True
+                break
+            for conn in ready:
+                name, proc = running.pop(conn)
+                try:
+                    status, payload, seconds = conn.recv()
+                except EOFError:
+                    status, payload, seconds = 'failed', "worker died", time.time() - start
+                conn.close()
+                proc.join()
+                record = records[name]
+                record['status'] = status
+                record['seconds'] = seconds
+                if status == 'done':
+                    results[name] = payload
+                    record['cubes'] = len(payload)
+                    record['literals'] = cover_literals(payload)
+                else:
+                    record['error'] = payload
+            if policy == 'first' and results:
+                break
+    finally:
+        for conn, (name, proc) in running.items():
+            proc.terminate()
+            proc.join()
+            conn.close()
+            records[name]['status'] = 'timeout' if timedOut else 'cancelled'
+            records[name]['seconds'] = time.time() - start
+
+    finished = [records[name] for name in results]
+    if finished:
+        if policy == 'first':
+            winner = min(finished, key=lambda r: r['seconds'])['variant']
+        else:
+            winner = min(finished, key=lambda r: _score(policy, r))['variant']
+        records[winner]['status'] = 'won'
+
+    records = list(records.values())
+    _report(records, policy)
+    if log is not None:
+        _write_log(log, records, pairs, ninputs, noutputs, policy, deadline)
+    if not finished:
+        if timedOut:
+            raise TimeoutError(f"no espresso variant finished within {deadline} s")
+        raise PortfolioError({r['variant']: r.get('error', r['status']) for r in records})
+    return winner, results[winner], records
+
+def _report(records, policy):
+    print(f"policy {policy}:")
+    print(f"{'variant':10} {'status':9} {'cubes':>6} {'literals':>9} {'seconds':>8}")
+    for r in records:
+        cubes = '' if r['cubes'] is None else r['cubes']
+        literals = '' if r['literals'] is None else r['literals']
+        print(f"{r['variant']:10} {r['status']:9} {cubes:>6} {literals:>9} {r['seconds']:8.2f}")
+
+def _write_log(path, records, pairs, ninputs, noutputs, policy, deadline):
+    # the cover is identified by its hash, like result_cache keys
+    cover = cache_key("cover", (f"{i} {o}" for i, o in pairs), {})
+    with open(path, "a") as f:
+        for r in records:
+            entry = dict(r, time=time.time(), cover=cover, rows=len(pairs),
+                         ninputs=ninputs, noutputs=noutputs, policy=policy,
+                         deadline=deadline)
+            f.write(json.dumps(entry) + "\n")
+
+def race_file(fin, fout, variants=None, policy='smallest', deadline=None,
+              log=DEFAULT_LOG):
+    """Race the variants on a PLA file and write the winning cover."""
+    d = read_pla(fin)
+    winner, cubes, _ = race(d['ninputs'], d['noutputs'], d['cover'], variants,
+                            policy, deadline, file_intype(d), log)
+    print(f"{winner} wins with {len(cubes)} cubes")
+    write_pla(fout, d['ninputs'], d['noutputs'], cubes,
+              d['input_labels'], d['output_labels'])
+    return winner, cubes
+
+
+PARSER = argparse.ArgumentParser(description=__doc__,
+                                 formatter_class=argparse.RawDescriptionHelpFormatter)
+PARSER.add_argument('file', help="PLA file to minimize")
+PARSER.add_argument('output', help="PLA file for the winning cover")
+PARSER.add_argument('--policy', choices=POLICIES, default='smallest')
+PARSER.add_argument('--deadline', type=float, default=None,
+                    help="seconds to wait for the variants (default: no limit)")
+PARSER.add_argument('--variants', nargs='+', choices=sorted(VARIANTS),
+                    default=None, help="variants to race (default: all)")
+PARSER.add_argument('--log', default=DEFAULT_LOG,
+                    help=f"JSON lines file the results are appended to (default: {DEFAULT_LOG})")
+
+def main(argv=None):
+    opts = PARSER.parse_args(argv)
+    variants = None
+    if opts.variants:
+        variants = {name: VARIANTS[name] for name in opts.variants}
+    try:
+        race_file(opts.file, opts.output, variants, opts.policy, opts.deadline, opts.log)
+    except (TimeoutError, PortfolioError) as exc:
+        print(exc)
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,74 @@
+"""\
+Incremental re-minimization of a changed strategy table.
+
+When the table is regenerated, most rows keep their move. Only the
+cubes of the previous cover that contain a changed row are dropped.
+The rows they covered are minimized again together with the changed
+rows, and the new cubes are spliced into the rest of the cover.
+"""
+
+import numpy as np
+
+from cover_eval import cube_masks, evaluate_cover, table_arrays
+from equivalence import _bits, check_cover
+from espresso_func import minimize_cover, read_pla, string_cover, write_pla
+
+
+def reminimize(cubes, table, config=None, verify=True):
+    """Update a minimized cover after the table changed.
+
+    cubes is the previous cover as (input, output) strings and table the
+    new bitLookup. Returns the new cover, checked against the table
+    unless verify is False.
+    """
+    ninputs = len(next(iter(table)))
+    noutputs = len(next(iter(table.values())))
+    keys, values = table_arrays(table)
+    changed = evaluate_cover(cubes, keys) != values
+    print(f"{int(changed.sum())} of {len(keys)} rows changed")
+    if not changed.any():
+        return list(cubes)
+
+    # cubes containing a changed row are invalidated, the rest stay correct
+    masks, cubeValues, _ = cube_masks(cubes)
+    changedKeys = keys[changed]
+    kept = []
+    region = changed.copy()
+    for cube, mask, value in zip(cubes, masks, cubeValues):
+        if np.any((changedKeys & mask) == value):
+            region |= (keys & mask) == value
+        else:
+            kept.append(cube)
+    print(f"{len(cubes) - len(kept)} of {len(cubes)} cubes invalidated, "
+          f"re-minimizing {int(region.sum())} rows")
+
+    # outputs the kept cubes already give are don't cares, zeros stay OFF-set
+    given = evaluate_cover(kept, keys)
+    rows = []
+    for key, value, produced, inRegion in zip(keys, values, given, region):
+        outvec = []
+        for bit in _bits(value, noutputs)[::-1]:
+            isGiven = produced & 1
+            produced >>= np.uint64(1)
+            if bit == '0':
+                outvec.append('0')
+            elif isGiven or not inRegion:
+                outvec.append('-')
+            else:
+                outvec.append('1')
+        rows.append((_bits(key, ninputs), "".join(reversed(outvec))))
+
+    # as .type fr, a '-' output is in neither the ON nor the OFF-set
+    added = minimize_cover(ninputs, noutputs, rows, config)
+    result = sorted(kept + added)
+    if verify:
+        check_cover(result, table)
+    return result
+
+def reminimize_file(oldPla, table, outPla, config=None):
+    """Re-minimize a table against the cover saved in oldPla, write outPla."""
+    d = read_pla(oldPla)
+    cubes = reminimize(string_cover(d['cover']), table, config)
+    write_pla(outPla, d['ninputs'], d['noutputs'], cubes,
+              d['input_labels'], d['output_labels'])
+    return cubes
@@ -1,29 +1,25 @@
 # preprocessing c table into something more managable
-import pyeda
+import bisect
+import heapq
 import os
+import itertools
+import math
 import string
 import time
-import re
+import weakref
 
-# only white figures movement are of concern
-# isWhiteTurn, isRookCaptured, BKx, BKy, WKx, WKy, WRx, WRy
-lookup = {}
-BOARD_SIZE = 4
+from merge_stats import counters, PrintObserver, IterationStats, Progress
+from result_cache import cache_key
+# positions in the initial read table, and the bits coding a direction
+from table_loader import UDLR_BITS, BKx, BKy, WKx, WKy, WRx, WRy, keyLen, posBitLen
 
-# number of bits for coding the direction
-UDLR_BITS = 4
+# board size main() runs on. everything depending on the board size takes
+# it as an argument, pipeline.JobConfig collects them for a run
+DEFAULT_BOARD_SIZE = 4
 
 # is tracking of move fields in 2 directions or 1
 NUM_DIR_MOVES = 2
 
-POS_BIT_LEN = 3
-if BOARD_SIZE <=4:
-    POS_BIT_LEN = 2
-elif BOARD_SIZE <= 8:
-    POS_BIT_LEN = 3
-else:
-    raise ValueError('Not accepting board sizes above 8')
-
 # size, diet, venom, legs3, legs2 legs1, europe, dangerous 
 animalsDangerous = []
 animalsDangerous.append("1101000") # lion
@@ -39,45 +35,17 @@ animalsSafe.append("1000000") # sea cow
 
 animals = animalsSafe
 
-# 6, for each of three pieces and their x and y axis
-TOTAL_KEY_LEN = 6 * POS_BIT_LEN 
-# Length of codomain that lookup table maps to king bits
-TOTAL_VAL_LEN = UDLR_BITS
-# rook bits
-TOTAL_VAL_LEN += UDLR_BITS + NUM_DIR_MOVES * POS_BIT_LEN
-#positions in initial raed table
-BKx = 2
-BKy = 3
-WKx = 4
-WKy = 5
-WRx = 6
-WRy = 7
-
 def main():
     goIntoScriptDir()
     #mergeFormulas(animals, useFaster=True)
     #exit()
-    readInputFile(isOptimal = False)
-    convertToBits()
-
-    BEFORE_MINIMIZATION_LENGTH = len(bitLookup)
-    print('before minimization length = ', BEFORE_MINIMIZATION_LENGTH)
-    someKey = next(iter(bitLookup))
-    print('Key length = ', len(someKey), 'Value length = ', len(bitLookup[someKey]) )
-
-    #GENERATED_PLA = f"original{BOARD_SIZE}x{BOARD_SIZE}.pla"
-    #print("writing table to pla file...")
-    #tableToPla(bitLookup, GENERATED_PLA)
-
+    # read -> filter -> merge every move on its own -> csv of the whole table,
+    # see pipeline.runJob. pipeline.py runs several boards and strategies
+    from pipeline import JobConfig, runJob
     # r"0..0........" is for king going up and right
-    filteredLookup =  filterTable(bitLookup, byKey=r"............" ,byValue=r"............")
-    print("Filtered length = ", len(filteredLookup))
-    #printTable(filteredLookup)
-    mergeFormulas(filteredLookup, useFaster=True)
-    #MINIMIZED_OUTPUT_FILE = f"minimized{BOARD_SIZE}x{BOARD_SIZE}.pla"
-    #print(f"Saved to {MINIMIZED_OUTPUT_FILE}")
-
-    writeCsv(bitLookup)
+    config = JobConfig(DEFAULT_BOARD_SIZE, 'Strategy', byKey=r"............",
+                       byValue=r"............", minimizer='merge', exports=('csv',))
+    runJob(config)
 
     print("Finished.")
 
@@ -86,10 +54,16 @@ def goIntoScriptDir():
     dname = os.path.dirname(abspath)
     os.chdir(dname)
     
-def readInputFile(isOptimal):
-    print ("reading file...")
+def inputTableFile(isOptimal, boardSize = DEFAULT_BOARD_SIZE):
     chessStrategType = "Dict" if isOptimal else "Strategy"
-    INPUT_TABLE_FILE = f'tableGen/chess{chessStrategType}{BOARD_SIZE}x{BOARD_SIZE}.txt' 
+    return f'tableGen/chess{chessStrategType}{boardSize}x{boardSize}.txt'
+
+# only white figures movement are of concern. returns a new dict
+# (isWhiteTurn, isRookCaptured, BKx, BKy, WKx, WKy, WRx, WRy) -> the same after the move
+def readInputFile(isOptimal, boardSize = DEFAULT_BOARD_SIZE):
+    print ("reading file...")
+    lookup = {}
+    INPUT_TABLE_FILE = inputTableFile(isOptimal, boardSize)
     with open(INPUT_TABLE_FILE, 'r') as f:
         next(f) # skips file comment
         # make a dict
@@ -104,6 +78,7 @@ def readInputFile(isOptimal):
                 lookup[key] = tup
     print('finished!')
     print("Items read = ", len(lookup))
+    return lookup
 
 # N E W code
 # maps from current game state into optimal move
@@ -112,12 +87,12 @@ def readInputFile(isOptimal):
 # value: up, down left, right each 1 bit for king
 #   up, down, left, right each 1 bit for rook + num bits x2 for how many fields (first x then y axis)
 # kup, kdwn, kleft, kright, rup, rdwn, rlft, rrght, x3, x2, x1, y3, y2, y1
-bitLookup = {}
+# convertToBits builds this bitLookup dict from readInputFile's lookup
 
 # returns a list of bools indicating the number
-def numberIntoBits(num):
-    #return [i == num for i in range(BOARD_SIZE)]
-    return bin(num)[2:].zfill(POS_BIT_LEN)
+def numberIntoBits(num, posBitLen):
+    #return [i == num for i in range(boardSize)]
+    return bin(num)[2:].zfill(posBitLen)
 
 #returns true if king played. considering the table, its only false when rook played
 def didKingPlay(key, value):
@@ -150,16 +125,20 @@ def getRookDirectionAndDistance(key, value):
 def boolList2BinString(lst):
     return ''.join(['1' if x else '0' for x in lst])
 
-def convertToBits():
+def convertToBits(lookup, boardSize = DEFAULT_BOARD_SIZE):
     print("Converting to bits...")
+    posBits = posBitLen(boardSize)
+    # king bits, then rook bits
+    valLen = UDLR_BITS + UDLR_BITS + NUM_DIR_MOVES * posBits
+    bitLookup = {}
     for key, val in lookup.items():
-        keyBits = numberIntoBits(key[BKx])
-        keyBits += numberIntoBits(key[BKy]) 
-        keyBits += numberIntoBits(key[WKx]) 
-        tmp = numberIntoBits(key[WKy])
+        keyBits = numberIntoBits(key[BKx], posBits)
+        keyBits += numberIntoBits(key[BKy], posBits)
+        keyBits += numberIntoBits(key[WKx], posBits)
+        tmp = numberIntoBits(key[WKy], posBits)
         keyBits += tmp 
-        keyBits += numberIntoBits(key[WRx]) 
-        keyBits += numberIntoBits(key[WRy]) 
+        keyBits += numberIntoBits(key[WRx], posBits)
+        keyBits += numberIntoBits(key[WRy], posBits)
         
         valueBits = ''
         isKing = didKingPlay(key, val)
@@ -167,26 +146,27 @@ def convertToBits():
         if isKing:
             valueBits += boolList2BinString( getKingDirection(key, val) )
             # fill with 0s on the right for rook bits
-            valueBits = valueBits.ljust(TOTAL_VAL_LEN, '0')
+            valueBits = valueBits.ljust(valLen, '0')
             #print("king valueBits len", len(valueBits))
         else:
             up,down,left,right,distance = getRookDirectionAndDistance(key, val)
             valueBits += boolList2BinString([up,down,left,right])
-            distanceBits = numberIntoBits(distance)
+            distanceBits = numberIntoBits(distance, posBits)
             if up or down:
                 #print(f"valueBits = {valueBits}")
                 #print(f"distanceBits old = {distanceBits}")
-                distanceBits = distanceBits.ljust(POS_BIT_LEN * 2, '0')
+                distanceBits = distanceBits.ljust(posBits * 2, '0')
                 #print(f"distanceBits new = {distanceBits}")
             else:
-                distanceBits = distanceBits.zfill(POS_BIT_LEN * 2)
+                distanceBits = distanceBits.zfill(posBits * 2)
             
             valueBits += distanceBits
             # fill with 0s on the left for king bits
-            valueBits = valueBits.zfill(TOTAL_VAL_LEN)
+            valueBits = valueBits.zfill(valLen)
             #print("rook valueBits len", len(valueBits))
 
         bitLookup[keyBits] = valueBits
+    return bitLookup
 
 def printTable(table):
     print("printing table.")
@@ -195,52 +175,51 @@ def printTable(table):
     print(f"Table has {len(table)} items.")
 
 
+# byKey and byValue are patterns like r"0..0........", with 0, 1 and '.' only,
+# or bit_filter predicates combining several of them with & and |
 def filterTable(table, byKey = None, byValue = None):
-    resultTable = table
-    if byKey is not None:
-        resultTable = {k:v for k,v in resultTable.items() if re.match(byKey, k)}
-    if byValue is not None:
-        resultTable = {k:v for k,v in resultTable.items() if re.match(byValue, v)}
-    return resultTable
-
-def tableToPla(table, fileName):
-    f = open(fileName, "w")
-    aKey = next(iter(table))
-    aVal = table[aKey]
-    keySize = len(aKey)
-    valSize = len(aVal)
-    print(f".i {keySize}", file=f)
-    print(f".o {valSize}", file=f)
-    numEntries = len(table)
-    print(f".p {numEntries}", file=f)
-    print(".type fr", file=f)
-    for key, val in table.items():
-        print(f"{key} {val}", file=f)
-    f.close()
+    from bit_filter import iterSelected
+    return dict(iterSelected(table, byKey, byValue))
+
+# table is a dict of bit strings like bitLookup, or (packed keys, packed
+# values) like table_loader gives. every row is one cube, as ON-set and
+# OFF-set (.type fr)
+def tableToPla(table, fileName, boardSize = DEFAULT_BOARD_SIZE):
+    import pla_io
+    import table_loader
+    if isinstance(table, dict):
+        aKey = next(iter(table))
+        keySize = len(aKey)
+        valSize = len(table[aKey])
+    else:
+        keySize = table_loader.keyLen(boardSize)
+        valSize = table_loader.valLen(boardSize)
+        table = pla_io.table_cubes(table[0], table[1], keySize, valSize)
+    pla_io.write_pla(fileName, keySize, valSize, table,
+                     intype=pla_io.FTYPE | pla_io.RTYPE)
 
-def writeCsv(table):
+# table is a dict of bit strings like bitLookup, or (packed keys, packed
+# values) like table_loader gives. with columnarEncoding ('bits' or 'bytes')
+# the columnar binary file of table_export is written next to the csv.
+# baseName defaults to original{boardSize}x{boardSize}
+def writeCsv(table, columnarEncoding = None, boardSize = DEFAULT_BOARD_SIZE, baseName = None):
+    import table_export
     print("writing csv")
-    import csv
-    fieldnames = ['BKX1', 'BKX2', 'BKY1', 'BKY2', 'WKX1', 'WKX2', 'WKY1', 'WKY2', 'WRX1', 'WRX2', 'WRY1', 'WRY2']
-    fieldnames.extend(['KU', 'KD', 'KL', 'KR', 'RU', 'RD', 'RL', 'RR', 'RX1', 'RX2', 'RY1', 'RY2'])
-
-    # newline='' is for windows not to put newlines after each row
-    with open(f"original{BOARD_SIZE}x{BOARD_SIZE}.csv", 'w', newline='') as csvfile:
-        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-
-        writer.writeheader()
-        for key, val in table.items():
-            row = {}
-            # write a row, taking items from key first, then from val
-            for i, item in enumerate(fieldnames):
-                if i < TOTAL_KEY_LEN:
-                    row[item] = item if key[i] == '1' else "~" + item
-                else:
-                    row[item] = item if val[i - TOTAL_KEY_LEN] == '1' else "~" + item
-            writer.writerow(row)
+    if isinstance(table, dict):
+        from cover_eval import table_arrays
+        keys, values = table_arrays(table)
+    else:
+        keys, values = table
+    if baseName is None:
+        baseName = f"original{boardSize}x{boardSize}"
+    table_export.writeCsv(baseName + ".csv", keys, values, boardSize)
+    if columnarEncoding is not None:
+        table_export.writeColumnar(baseName + ".krkc", keys, values, boardSize,
+                                   encoding=columnarEncoding)
     print("finished writing csv")
 
-def analyzeOutput(outputFile):
+def analyzeOutput(outputFile, boardSize = DEFAULT_BOARD_SIZE):
+    keyBits = keyLen(boardSize)
     numLines = 0
     countDontCare = 0
     with open(outputFile, 'r') as f:
@@ -251,130 +230,217 @@ def analyzeOutput(outputFile):
     numLines -= numSkipLines
     #print(f"Before minimization length = {BEFORE_MINIMIZATION_LENGTH}")
     print(f"After minimization length = {numLines}, dont cares = {countDontCare}.")
-    print(f'total key len = {TOTAL_KEY_LEN}')
-    percentDontCare = countDontCare/ (numLines * TOTAL_KEY_LEN)
+    print(f'total key len = {keyBits}')
+    percentDontCare = countDontCare/ (numLines * keyBits)
     print(f"That's {percentDontCare}% dont care bits.")
 
+class FormulaGroup:
+    # one merged block, the formulas or-ed together. groups are interned
+    # like formulas, so two groups are equal only when they are the same
+    # object, and hash by identity
+    __slots__ = ('formulas', '__weakref__')
+
+    _interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, formulas):
+        if isinstance(formulas, FormulaGroup):
+            return formulas
+        formulas = tuple(formulas)
+        self = cls._interned.get(formulas)
+        if self is None:
+            self = object.__new__(cls)
+            self.formulas = formulas
+            cls._interned[formulas] = self
+        return self
+
+    def __iter__(self):
+        return iter(self.formulas)
+
+    def __len__(self):
+        return len(self.formulas)
+
+    def __getitem__(self, i):
+        return self.formulas[i]
+
+    def __reduce__(self):
+        return (FormulaGroup, (self.formulas,))
+
 class Formula:
-    def __init__(self, fixed = None, merged = [], bstring = None):
-        # set of fixed bits. Intended usage: (a, A, b...)
+    # a conjunction of fixed bits, kept as two integer masks: bit i of care
+    # is set when the i-th variable is fixed, and bit i of value holds its
+    # polarity (1 for 'A', 0 for 'a').
+    # formulas are immutable and interned: building a formula that already
+    # exists gives back the same object, so identical sub-formulas are
+    # stored once. merged is a tuple of FormulaGroups and groups is the
+    # same groups as a frozenset
+    __slots__ = ('care', 'value', 'merged', 'groups', '_hash', '__weakref__')
+
+    _interned = weakref.WeakValueDictionary()
+
+    def __new__(cls, fixed = None, merged = None, bstring = None, care = 0, value = 0):
         if bstring is not None:
             # expecting string with only 0s or 1s
-            lower = string.ascii_lowercase
-            upper = string.ascii_uppercase
-            fixed = set()
-            for i, chr in enumerate(bstring):
-                elem = lower[i] if chr == '0' else upper[i]
-                fixed.add(elem)
+            care = (1 << len(bstring)) - 1
+            value = int(bstring[::-1], 2) if bstring else 0
+        elif fixed is not None:
+            # set of fixed bits. Intended usage: (a, A, b...)
+            for bit in fixed:
+                i = string.ascii_lowercase.index(bit.lower())
+                care |= 1 << i
+                if bit.isupper():
+                    value |= 1 << i
+        value &= care
+        # product of sums of products
+        merged = tuple(FormulaGroup(disj) for disj in merged) if merged else ()
+        key = (care, value, merged)
+        self = cls._interned.get(key)
+        if self is not None:
+            return self
+        self = object.__new__(cls)
+        setattr_ = object.__setattr__
+        setattr_(self, 'care', care)
+        setattr_(self, 'value', value)
+        setattr_(self, 'merged', merged)
+        setattr_(self, 'groups', frozenset(merged))
+        setattr_(self, '_hash', hash((care, value, self.groups)))
+        cls._interned[key] = self
+        return self
 
-        self.fixed = set(fixed) if fixed is not None else set()
-        # list of list of formulas, that is, product of sums of products
-        self.merged = merged
+    def __setattr__(self, name, value):
+        raise AttributeError("Formula is immutable")
+
+    def __reduce__(self):
+        # pickled by value, interned again when loaded
+        return (Formula, (None, self.merged, None, self.care, self.value))
+
+    @property
+    def fixed(self):
+        # set of fixed bits as letters, as it used to be stored
+        return set(self._letters())
+
+    def _letters(self):
+        letters = []
+        care = self.care
+        i = 0
+        while care:
+            if care & 1:
+                isUpper = (self.value >> i) & 1
+                letters.append(string.ascii_uppercase[i] if isUpper else string.ascii_lowercase[i])
+            care >>= 1
+            i += 1
+        return letters
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if not isinstance(other, Formula):
             return False
-        if self.fixed != other.fixed:
-            return False
-        if len(self.merged) == 0 and len(other.merged) == 0:
-            return True
-        for i in self.merged:
-            if i not in other.merged:
-                return False
-        for i in other.merged:
-            if i not in self.merged:
-                return False
-        return True
+        # same fixed bits, and every merged block of one is found in the other
+        return (self._hash == other._hash and self.care == other.care
+                and self.value == other.value and self.groups == other.groups)
 
+    def __hash__(self):
+        return self._hash
 
     def similarity(self, other):
-        d = len(self.fixed.intersection(other.fixed))
+        counters.similarityCalls += 1
+        # number of fixed bits both have with the same polarity
+        d = (self.care & other.care & ~(self.value ^ other.value)).bit_count()
         for i in self.merged:
-            if i in other.merged:
+            if i in other.groups:
                 # this probably isn't the best metric,
                 # maybe number of products within this lists element
-                d += len(i[0].fixed)
+                d += i[0].care.bit_count()
         return d
 
     def simplify(self):
+        # returns the simplified formula
         if len(self.merged) == 0:
-            return
-        for disj in self.merged[:]:
-            conjLen = len(disj[0].fixed)
-            # eg. a or A, then remove it 
-            if conjLen * 2 == len(disj):
-                self.merged.remove(disj)
+            return self
+        merged = list(self.merged)
+        for disj in self.merged:
+            if isinstance(disj[0], str):
+                # already simplified
                 continue
-            # ab or AB simplify to a eq b
-            canSimplify = conjLen == 2 and len(disj) == 2
+            conjLen = disj[0].care.bit_count()
+            sameBits = all(f.care == disj[0].care for f in disj)
+            # eg. a or A, then remove it. every polarity of the bits has to be there
+            if sameBits and len({f.value for f in disj}) == 1 << conjLen:
+                merged.remove(disj)
+                continue
+            # ab or AB simplify to a eq b, aB or Ab to a xor b
+            canSimplify = sameBits and conjLen == 2 and len(disj) == 2
             if not canSimplify:
                 continue
-            lst1 = list(disj[0].fixed)
-            lst2 = list(disj[1].fixed)
+            lst1 = disj[0]._letters()
+            lst2 = disj[1]._letters()
             a1 = lst1[0].islower()
             b1 = lst1[1].islower()
             a2 = lst2[0].islower()
             b2 = lst2[1].islower()
             if a1 != a2 and b1 != b2:
-                self.merged.remove(disj)
-                disj = [str(lst1[0]) + " eq "  + str(lst1[1])]
-                self.merged.append(disj)
-            elif a1 != b1 and a2 != b2:
-                self.merged.remove(disj)
-                disj = [str(lst1[0]) + " xor "  + str(lst1[1])]
-                self.merged.append(disj)
+                merged.remove(disj)
+                op = " eq " if a1 == b1 else " xor "
+                merged.append(FormulaGroup((str(lst1[0]) + op + str(lst1[1]),)))
+        return Formula(care=self.care, value=self.value, merged=merged)
 
     def size(self):
-        count = len(self.fixed)
-        for i in self.merged:
-            count += i.size()
+        count = self.care.bit_count()
+        for disj in self.merged:
+            for f in disj:
+                count += f.size()
         return count
     
     def canMerge(self, other):
-        lowerA = [i.lower() for i in self.fixed]
-        lowerB = [i.lower() for i in other.fixed]
-        inter = set(lowerA).intersection(set(lowerB))
+        counters.canMergeCalls += 1
         # they can merge if they have the same fixed bits
-        if len(inter) == len(lowerA) and len(inter) == len(lowerB):
+        if self.care == other.care:
             return True
         # or if they have same merged blocks
-        allSame = True
-        for i in self.merged:
-            if i not in other.merged:
-                allSame = False
-                break
-        for i in other.merged:
-            if i not in self.merged:
-                allSame = False
-                break
-        return allSame
+        if self.groups != other.groups:
+            counters.rejections += 1
+            return False
+        return True
 
     def merge(self, other):
         # its expected that canMerge(self, other) would return true
-        aMinusB = self.fixed - other.fixed
-        bMinusA = other.fixed - self.fixed
-        inter = self.fixed.intersection(other.fixed)
+        counters.merges += 1
+        # fixed bits both have with the same polarity
+        inter = self.care & other.care & ~(self.value ^ other.value)
+        aMinusB = self.care & ~inter
+        bMinusA = other.care & ~inter
         merged = []
-        if len(aMinusB) != 0:
-            merged.append(Formula(aMinusB))
-        if len(bMinusA) != 0:
-            merged.append(Formula(bMinusA))
+        if aMinusB != 0:
+            merged.append(Formula(care=aMinusB, value=self.value))
+        if bMinusA != 0:
+            merged.append(Formula(care=bMinusA, value=other.value))
         # prevent the list of having formulas instead of list of formulas
-        merged = [merged] if len(merged) != 0 else merged
+        merged = (FormulaGroup(merged),) if len(merged) != 0 else ()
         unique_data = Formula.naiveUniqueJoin(merged, self.merged)
         unique_data = Formula.naiveUniqueJoin(unique_data, other.merged)
-        x = Formula(inter, unique_data)
+        x = Formula(care=inter, value=self.value, merged=unique_data)
         return x
     
+    def toTuple(self):
+        # plain nested tuples, used to store formulas on disk
+        return (self.care, self.value,
+                tuple(tuple(f.toTuple() for f in disj) for disj in self.merged))
+
+    @staticmethod
+    def fromTuple(data):
+        care, value, merged = data
+        merged = [[Formula.fromTuple(f) for f in disj] for disj in merged]
+        return Formula(care=care, value=value, merged=merged)
+
     def __str__(self):
-        srtd = sorted(list(self.fixed), key=str.lower)
+        srtd = self._letters()
         if (len(srtd) == 0 and len(self.merged) == 0):
             return "empty"
         s = ""
         if len(srtd) > 0:
             s = "(" + " ".join(srtd) + ")"
         if len(self.merged) > 0:
-            #self.merged is a list of lists of Formula
+            #self.merged is a tuple of tuples of Formula
             # [ [a or A] and [b c or b C ] and [D or d]]
             s += " and "
             s += self._listOfListsToStr()
@@ -392,29 +458,28 @@ class Formula:
         s += "]"
         return s
 
-    # for unhashables
-    # expecting a,b to be list of lists of formula
+    # expecting a,b to be tuples of groups, returns a new tuple of groups
     @staticmethod
     def naiveUniqueJoin(a, b):
-        res = a
+        res = list(a)
         #!!! if we have [ab or AB] and incoming [aB], then make [ab or aB or AB]
         # each sublist is [ab or Ab...]
         for isublist in b:
             # see if these bits already exist [bits or BiTs or ...]
-            whichBits = {bit.lower() for bit in isublist[0].fixed}
+            whichBits = isublist[0].care
             foundMatch = False # should add whole isublist to result?
-            for jsublist in res:
-                alreadyBits = {bit.lower() for bit in jsublist[0].fixed}
+            counters.joinComparisons += len(res)
+            for k, jsublist in enumerate(res):
                 # if this is that group of bits
-                if alreadyBits == whichBits:
+                if jsublist[0].care == whichBits:
                     foundMatch = True
                     # append those that are not already in it
-                    # When using only 'if', put 'for' in the beginning
-                    jsublist.extend([f for f in isublist if f not in jsublist ])
+                    present = set(jsublist)
+                    res[k] = FormulaGroup(jsublist.formulas + tuple(f for f in isublist if f not in present))
 
             if not foundMatch:
                 res.append(isublist)
-        return res
+        return tuple(res)
         
 def TestFormula():
     print("TEST start")
@@ -445,71 +510,466 @@ def TestFormula():
     print("###")
     print("TEST end")
 
-def mergeFormulas(table, useFaster):
-    tableList = []
-    if isinstance(table, dict):
-        # make a list of Formulas from table
-        for k in table.keys():
-            f = Formula(bstring=k)
-            tableList.append(f)
-    else:
-        tableList = [Formula(bstring=row) for row in table]
+def TestPairingEngines(seed = 0, tables = 40):
+    # the faster pairing engines have to make exactly the merges of
+    # the plain scans over every pair, iteration by iteration, on random tables
+    import random
+    from vectorized_pairing import VectorizedBestPairEngine, greedyPairing
+    print("TEST start")
+    rng = random.Random(seed)
+    for t in range(tables):
+        width = rng.randint(3, 10)
+        numRows = rng.randint(2, min(80, 1 << width))
+        rows = [format(k, f"0{width}b") for k in rng.sample(range(1 << width), numRows)]
+        if t % 3 == 2:
+            # rows of different lengths have different fixed bits from the start
+            rows = [r[:rng.randint(max(2, width - 2), width)] for r in rows]
+        start = [Formula(bstring=r) for r in rows]
 
-    method = onePairingIteration if useFaster else onlyPairBestOnes
-    oldLength = len(tableList)
-    # while list is getting smaller
-    iteration = 0
+        expected = list(start)
+        index = list(start)
+        vectorized = list(start)
+        while True:
+            length = len(expected)
+            scanPairingIteration(expected)
+            onePairingIteration(index, 'python')
+            greedyPairing(vectorized)
+            assert index == expected, f"SupportIndex differs, seed {seed} table {t}"
+            assert vectorized == expected, f"greedyPairing differs, seed {seed} table {t}"
+            if len(expected) == length:
+                break
+
+        expected = list(start)
+        heap = list(start)
+        vectorizedHeap = list(start)
+        vectorized = list(start)
+        engine = BestPairEngine(heap)
+        vectorizedEngine = VectorizedBestPairEngine(vectorizedHeap)
+        while True:
+            length = len(expected)
+            onlyPairBestOnes(expected, 'python')
+            engine.mergeBest(heap)
+            vectorizedEngine.mergeBest(vectorizedHeap)
+            onlyPairBestOnes(vectorized, 'numpy')
+            assert heap == expected, f"BestPairEngine differs, seed {seed} table {t}"
+            assert vectorizedHeap == expected, f"VectorizedBestPairEngine differs, seed {seed} table {t}"
+            assert vectorized == expected, f"bestPairMerge differs, seed {seed} table {t}"
+            if len(expected) == length:
+                break
+    print(tables, "random tables paired the same by every engine")
+    print("TEST end")
+
+# backend: 'python' checks pairs one by one, 'numpy' packs the table into
+# arrays and scores blocks of rows at once (see vectorized_pairing.py)
+BACKENDS = ('python', 'numpy')
+
+def checkBackend(backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown backend {backend!r}, expected one of {BACKENDS}")
+
+# profile: None, 'cprofile' to dump cProfile stats into profileFile, or
+# 'tracemalloc' to report memory use of every iteration to the observers
+PROFILE_MODES = (None, 'cprofile', 'tracemalloc')
+
+# verify: raise equivalence.EquivalenceError unless the formulas describe
+# exactly the rows of the table.
+# budgetSeconds / maxIterations stop the merging early, returning the
+# formulas found so far (not cached). with checkpointFile the formulas are
+# saved there every checkpointEvery seconds and at the end, and with
+# resume an existing checkpoint of the same table and strategy is
+# continued
+def mergeFormulas(table, useFaster, backend = 'python', cache = None,
+                  observers = None, profile = None, profileFile = 'mergeFormulas.prof',
+                  verify = False, budgetSeconds = None, maxIterations = None,
+                  checkpointFile = None, checkpointEvery = 60.0, resume = False):
+    from checkpoint import Checkpoint, MergeBudget
+    checkBackend(backend)
+    rows = list(table.keys()) if isinstance(table, dict) else list(table)
+    oldLength = len(rows)
     start = time.time()
-    while True:
-        iteration += 1
-        print("iter",iteration)
-        oldSize = len(tableList)
-        tableList = method(tableList)
-        #tableList = onlyPairBestOnes(tableList)
-        newSize = len(tableList)
-        if iteration == 3:
-            pass
-            #break # tmp
-        if newSize == oldSize:
-            break
+    tableList = None
+    # the backends give the same merges, so only the strategy is part of the key.
+    # the rows keep their order, the greedy pairing depends on it
+    key = cache_key("mergeFormulas", rows, {'useFaster': useFaster}, ordered=True)
+    if cache is not None:
+        cached = cache.get(key)
+        if cached is not None:
+            print("cache hit")
+            tableList = [Formula.fromTuple(f) for f in cached]
+    if tableList is None:
+        budget = None
+        if budgetSeconds is not None or maxIterations is not None:
+            budget = MergeBudget(budgetSeconds, maxIterations)
+        checkpoint = None
+        if checkpointFile is not None:
+            checkpoint = Checkpoint(checkpointFile, key, checkpointEvery)
+            if not resume:
+                checkpoint.remove()
+        # make a list of Formulas from table
+        tableList = runMerging([Formula(bstring=row) for row in rows], useFaster, backend,
+                               observers, profile, profileFile, budget, checkpoint)
+        if budget is not None and budget.exhausted:
+            print("budget exhausted, returning the formulas found so far")
+        elif cache is not None:
+            cache.put(key, [f.toTuple() for f in tableList])
 
     end = time.time()
+    tableList = [f.simplify() for f in tableList]
     for i in tableList:
-        #continue
-        i.simplify()
         print(i)
     print("List len before = ", oldLength, "List len after merging = ", len(tableList))
     print("Time elpassed = ", end - start)
+    if verify:
+        from equivalence import check_formulas
+        check_formulas(tableList, rows)
+    return tableList
 
+def partitionByOutput(table):
+    # value -> its keys, in the order the values first appear in the table
+    partitions = {}
+    for key, val in table.items():
+        partitions.setdefault(val, []).append(key)
+    return partitions
 
-def onePairingIteration(tableList):
-    # one iteration of pairing up    
-    # pair up two closest 'rows'
-    length = len(tableList)
+def _mergePartition(job):
+    rows, useFaster, backend = job
+    return runMerging([Formula(bstring=row) for row in rows], useFaster, backend, observers=[])
+
+def mergeFormulasByOutput(table, useFaster, backend = 'python', cache = None,
+                          workers = None, verify = False):
+    # mergeFormulas over each set of keys sharing a value, so no formula
+    # mixes positions with different moves. the partitions are merged in
+    # a process pool (inline with workers=1), largest first, and returned
+    # as value -> formulas in the order of partitionByOutput
+    from concurrent.futures import ProcessPoolExecutor
+    checkBackend(backend)
+    partitions = partitionByOutput(table)
+    start = time.time()
+    merged = {}
+    keys = {}
+    if cache is not None:
+        for val, rows in partitions.items():
+            # the same key mergeFormulas would use for these rows
+            keys[val] = cache_key("mergeFormulas", rows, {'useFaster': useFaster},
+                                  ordered=True)
+            cached = cache.get(keys[val])
+            if cached is not None:
+                merged[val] = [Formula.fromTuple(f) for f in cached]
+    todo = sorted((val for val in partitions if val not in merged),
+                  key=lambda val: -len(partitions[val]))
+    jobs = [(partitions[val], useFaster, backend) for val in todo]
+
+    def collect(results):
+        for val, tableList in zip(todo, results):
+            merged[val] = tableList
+            if cache is not None:
+                cache.put(keys[val], [f.toTuple() for f in tableList])
+
+    if workers == 1:
+        collect(map(_mergePartition, jobs))
+    else:
+        # the pool is shut down even when a partition raises
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            collect(pool.map(_mergePartition, jobs))
+    end = time.time()
+
+    result = {}
+    for val, rows in partitions.items():
+        tableList = [f.simplify() for f in merged[val]]
+        print(val, len(rows), "->", len(tableList))
+        for f in tableList:
+            print("   ", f)
+        if verify:
+            from equivalence import check_formulas
+            check_formulas(tableList, rows)
+        result[val] = tableList
+    total = sum(len(tableList) for tableList in result.values())
+    print("Partitions = ", len(partitions), "List len before = ", len(table),
+          "List len after merging = ", total)
+    print("Time elpassed = ", end - start)
+    return result
+
+# progressInterval: seconds between onProgress reports to the observers
+def runMerging(tableList, useFaster, backend, observers = None, profile = None,
+               profileFile = 'mergeFormulas.prof', budget = None, checkpoint = None,
+               progressInterval = 1.0):
+    if profile not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode {profile!r}, expected one of {PROFILE_MODES}")
+    if observers is None:
+        observers = [PrintObserver()]
+    iteration = 0
+    done = False
+    if checkpoint is not None:
+        saved = checkpoint.load()
+        if saved is not None:
+            iteration, formulas, done = saved
+            tableList = [Formula.fromTuple(f) for f in formulas]
+            print(f"resuming from {checkpoint.path} at iter {iteration}, {len(tableList)} rows")
+    startIteration = iteration
+    if useFaster:
+        method = lambda tableList: onePairingIteration(tableList, backend)
+    elif backend == 'numpy':
+        from vectorized_pairing import VectorizedBestPairEngine
+        method = VectorizedBestPairEngine(tableList).mergeBest
+    else:
+        # same merges as onlyPairBestOnes, without rescanning every pair
+        method = BestPairEngine(tableList).mergeBest
+    for observer in observers:
+        observer.onStart(len(tableList))
+    if budget is not None:
+        budget.start()
+    if profile == 'cprofile':
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    elif profile == 'tracemalloc':
+        import tracemalloc
+        tracemalloc.start()
+    # while list is getting smaller, and there is budget left
+    start = time.perf_counter()
+    startSize = len(tableList)
+    lastReport = (start, startSize)
+    try:
+        while not done:
+            iteration += 1
+            counters.reset()
+            iterStart = time.perf_counter()
+            oldSize = len(tableList)
+            tableList = method(tableList)
+            newSize = len(tableList)
+            memoryCurrent, memoryPeak = None, None
+            if profile == 'tracemalloc':
+                memoryCurrent, memoryPeak = tracemalloc.get_traced_memory()
+                tracemalloc.reset_peak()
+            now = time.perf_counter()
+            stats = IterationStats(iteration, oldSize, newSize, now - iterStart,
+                                   counters.asDict(), memoryCurrent, memoryPeak)
+            for observer in observers:
+                observer.onIteration(stats)
+            done = newSize == oldSize
+            if now - lastReport[0] >= progressInterval:
+                recentRate = (lastReport[1] - newSize) / (now - lastReport[0])
+                progress = Progress(iteration, startSize, newSize, now - start, recentRate,
+                                    budget.timeLeft() if budget is not None else None)
+                for observer in observers:
+                    observer.onProgress(progress)
+                lastReport = (now, newSize)
+            if done or (budget is not None and budget.check(iteration - startIteration)):
+                break
+            if checkpoint is not None and checkpoint.maybeSave(iteration, tableList):
+                for observer in observers:
+                    observer.onCheckpoint(checkpoint.path, iteration, newSize)
+    finally:
+        if profile == 'cprofile':
+            profiler.disable()
+            profiler.dump_stats(profileFile)
+        elif profile == 'tracemalloc':
+            tracemalloc.stop()
+    if checkpoint is not None:
+        # the final state, marked done when merging converged
+        checkpoint.save(iteration, tableList, done)
+        for observer in observers:
+            observer.onCheckpoint(checkpoint.path, iteration, len(tableList))
+    for observer in observers:
+        observer.onFinish(len(tableList), time.perf_counter() - start)
+    return tableList
+
+def mergedKey(formula):
+    # hashable signature of formula.merged, equal for two formulas exactly
+    # when every merged block of one is found in the other
+    return formula.groups
+
+EMPTY_MERGED = frozenset()
+
+class SupportIndex:
+    # positions of tableList grouped by variable-support signature.
+    # canMerge is true only for formulas with the same fixed bits or the same
+    # merged blocks, so the candidates for a row are the union of its two buckets
+    def __init__(self, tableList):
+        # care -> value -> positions
+        self.byCare = {}
+        # merged key -> care -> positions
+        self.byMerged = {}
+        # care -> sorted positions, to count the rows after i sharing it
+        self.careRows = {}
+        self.keys = []
+        for idx, f in enumerate(tableList):
+            self.keys.append(None)
+            self.add(idx, f)
+
+    def add(self, idx, f):
+        key = mergedKey(f)
+        self.keys[idx] = key
+        self.byCare.setdefault(f.care, {}).setdefault(f.value, set()).add(idx)
+        self.byMerged.setdefault(key, {}).setdefault(f.care, set()).add(idx)
+        bisect.insort(self.careRows.setdefault(f.care, []), idx)
+
+    def remove(self, idx, f):
+        key = self.keys[idx]
+        values = self.byCare[f.care]
+        values[f.value].discard(idx)
+        if not values[f.value]:
+            del values[f.value]
+            if not values:
+                del self.byCare[f.care]
+        cares = self.byMerged[key]
+        cares[f.care].discard(idx)
+        if not cares[f.care]:
+            del cares[f.care]
+            if not cares:
+                del self.byMerged[key]
+        rows = self.careRows[f.care]
+        del rows[bisect.bisect_left(rows, idx)]
+        if not rows:
+            del self.careRows[f.care]
+
+    def candidates(self, i, f):
+        # every position after i that f can merge with, in increasing order
+        found = set()
+        for positions in self.byCare.get(f.care, {}).values():
+            found.update(j for j in positions if j > i)
+        for positions in self.byMerged.get(self.keys[i], {}).values():
+            found.update(j for j in positions if j > i)
+        return sorted(found)
+
+    def countChecks(self, tableList, i, compatible):
+        # the index settles canMerge for every row after i without calling it,
+        # count those checks like the linear scan would
+        checked = len(tableList) - 1 - i
+        counters.canMergeCalls += checked
+        counters.rejections += checked - compatible
+
+    def bestPartner(self, tableList, i):
+        # returns (similarity, j) of the first most similar row after i,
+        # the same pick a linear scan over tableList[i + 1:] would make
+        f = tableList[i]
+        bestCost = 0
+        index = None
+        if len(f.merged) != 0:
+            candidates = self.candidates(i, f)
+            self.countChecks(tableList, i, len(candidates))
+            for j in candidates:
+                similarity = f.similarity(tableList[j])
+                if similarity > bestCost:
+                    index = j
+                    bestCost = similarity
+            return bestCost, index
+
+        # without merged blocks similarity only counts agreeing fixed bits.
+        # rows with other fixed bits can only come from the empty-merged bucket
+        rows = self.careRows[f.care]
+        compatible = len(rows) - bisect.bisect_right(rows, i)
+        for care, positions in self.byMerged.get(EMPTY_MERGED, {}).items():
+            if care == f.care:
+                continue
+            for j in positions:
+                if j <= i:
+                    continue
+                compatible += 1
+                similarity = f.similarity(tableList[j])
+                if similarity > bestCost or (similarity == bestCost and index is not None and j < index):
+                    index = j
+                    bestCost = similarity
+
+        self.countChecks(tableList, i, compatible)
+
+        # same fixed bits: search by growing hamming distance over the values
+        values = self.byCare[f.care]
+        bits = [1 << b for b in range(f.care.bit_length()) if (f.care >> b) & 1]
+        numBits = len(bits)
+        budget = len(values)
+        for distance in range(numBits):
+            similarity = numBits - distance
+            if similarity < bestCost:
+                break
+            budget -= math.comb(numBits, distance)
+            if budget < 0:
+                # the ball got bigger than the bucket, just scan the bucket
+                for positions in values.values():
+                    for j in positions:
+                        if j <= i:
+                            continue
+                        similarity = f.similarity(tableList[j])
+                        if similarity > bestCost or (similarity == bestCost and index is not None and j < index):
+                            index = j
+                            bestCost = similarity
+                break
+            hit = None
+            for flipped in itertools.combinations(bits, distance):
+                positions = values.get(f.value ^ sum(flipped))
+                if positions is None:
+                    continue
+                for j in positions:
+                    if j > i and (hit is None or j < hit):
+                        hit = j
+            if hit is not None:
+                if similarity > bestCost or index is None or hit < index:
+                    index = hit
+                    bestCost = similarity
+                break
+        return bestCost, index
+
+
+def scanPairingIteration(tableList):
+    # onePairingIteration checking every pair after i, what SupportIndex and
+    # greedyPairing have to match. only used by TestPairingEngines
     for i in range(len(tableList) - 1):
-        # searching for max similarity
+        if i >= len(tableList) - 1:
+            break
         bestCost = 0
         index = None
         for j in range(i + 1, len(tableList)):
-            canMerge = tableList[i].canMerge(tableList[j])
-            if canMerge is False:
-                continue 
+            if tableList[i].canMerge(tableList[j]) is False:
+                continue
             similarity = tableList[i].similarity(tableList[j])
             if similarity > bestCost:
                 index = j
                 bestCost = similarity
         if index is not None:
             paired = tableList[i].merge(tableList[index])
-            # store it instead of i, and delete j
+            # store it instead of i, and delete index
             tableList[i] = paired
             if index != len(tableList) - 1:
                 tableList[index] = tableList.pop()
             else:
                 tableList.pop()
-    print("List len before = ", length, "List len after merging = ", len(tableList))
     return tableList
 
-def onlyPairBestOnes(tableList):
+def onePairingIteration(tableList, backend = 'python'):
+    # one iteration of pairing up    
+    # pair up two closest 'rows'
+    checkBackend(backend)
+    if backend == 'numpy':
+        from vectorized_pairing import greedyPairing
+        return greedyPairing(tableList)
+    index = SupportIndex(tableList)
+    for i in range(len(tableList) - 1):
+        if i >= len(tableList) - 1:
+            break
+        # searching for max similarity among the rows i can merge with
+        _, j = index.bestPartner(tableList, i)
+        if j is not None:
+            paired = tableList[i].merge(tableList[j])
+            last = len(tableList) - 1
+            index.remove(i, tableList[i])
+            index.remove(j, tableList[j])
+            # store it instead of i, and delete j
+            if j != last:
+                index.remove(last, tableList[last])
+                tableList[j] = tableList.pop()
+                index.add(j, tableList[j])
+            else:
+                tableList.pop()
+            index.keys.pop()
+            tableList[i] = paired
+            index.add(i, paired)
+    return tableList
+
+def onlyPairBestOnes(tableList, backend = 'python'):
+    checkBackend(backend)
+    if backend == 'numpy':
+        from vectorized_pairing import bestPairMerge
+        return bestPairMerge(tableList)
     totalBestCost = 0
     indexi = None
     indexj = None
@@ -533,6 +993,99 @@ def onlyPairBestOnes(tableList):
         else:
             tableList.pop()
     return tableList
+
+class BestPairEngine:
+    # does the same merges as calling onlyPairBestOnes over and over, but keeps
+    # the best partner of every row in a max-heap of (similarity, i, j), so a
+    # merge only recomputes the pairs involving the rows it changed
+    def __init__(self, tableList):
+        self.tableList = tableList
+        # position -> (similarity, j) of its first most similar row after it
+        self.best = [(0, None)] * len(tableList)
+        # bumped whenever best changes, heap entries with an old stamp are stale
+        self.stamps = [0] * len(tableList)
+        self.heap = []
+        for k in range(len(tableList)):
+            self._recompute(k)
+
+    def _score(self, k, j):
+        a = self.tableList[k]
+        b = self.tableList[j]
+        if a.canMerge(b) is False:
+            return 0
+        return a.similarity(b)
+
+    def _setBest(self, k, similarity, j):
+        self.stamps[k] += 1
+        self.best[k] = (similarity, j)
+        if j is not None:
+            heapq.heappush(self.heap, (-similarity, k, j, self.stamps[k]))
+
+    def _recompute(self, k):
+        bestCost = 0
+        index = None
+        for j in range(k + 1, len(self.tableList)):
+            similarity = self._score(k, j)
+            if similarity > bestCost:
+                index = j
+                bestCost = similarity
+        self._setBest(k, bestCost, index)
+
+    def _popBest(self):
+        heap = self.heap
+        length = len(self.tableList)
+        while heap:
+            _, i, j, stamp = heap[0]
+            if i < length and stamp == self.stamps[i]:
+                return i, j
+            heapq.heappop(heap)
+        return None, None
+
+    def mergeBest(self, tableList):
+        # merges the single best pair, like onlyPairBestOnes(tableList)
+        assert tableList is self.tableList
+        i, j = self._popBest()
+        if i is None:
+            return tableList
+        last = len(tableList) - 1
+        paired = tableList[i].merge(tableList[j])
+        # store it instead of i, and delete j
+        tableList[i] = paired
+        if j != last:
+            tableList[j] = tableList.pop()
+        else:
+            tableList.pop()
+        self.best.pop()
+        self.stamps.pop()
+        changed = (i, j, last)
+
+        for k in range(len(tableList)):
+            if k in changed:
+                continue
+            bestCost, index = self.best[k]
+            if index in changed:
+                self._recompute(k)
+                continue
+            # the rows that got new formulas may beat the current best
+            for x in (i, j):
+                if x <= k or x >= len(tableList):
+                    continue
+                similarity = self._score(k, x)
+                if similarity > bestCost or (similarity == bestCost and index is not None and x < index):
+                    bestCost = similarity
+                    index = x
+            if (bestCost, index) != self.best[k]:
+                self._setBest(k, bestCost, index)
+        self._recompute(i)
+        if j != last:
+            self._recompute(j)
+
+        # drop stale entries once they outnumber the live ones
+        if len(self.heap) > 4 * len(tableList) + 64:
+            self.heap = [(-s, k, x, self.stamps[k])
+                         for k, (s, x) in enumerate(self.best) if x is not None]
+            heapq.heapify(self.heap)
+        return tableList
     
 
 if __name__ == "__main__":
@@ -0,0 +1,170 @@
+# instrumentation for main_minimizer.mergeFormulas.
+# Formula methods and the pairing backends count their work into `counters`,
+# mergeFormulas turns that into one IterationStats per iteration and hands
+# it to the observers
+import json
+import time
+
+class MergeCounters:
+    __slots__ = ('canMergeCalls', 'rejections', 'similarityCalls', 'merges',
+                 'joinComparisons')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # row pairs checked for canMerge, and how many of those it rejected.
+        # the indexed and vectorized backends settle the check without
+        # calling Formula.canMerge but count every pair the same way
+        self.canMergeCalls = 0
+        self.rejections = 0
+        # similarities computed, the python index skips the ones it can rule out
+        self.similarityCalls = 0
+        self.merges = 0
+        # merged blocks compared inside Formula.naiveUniqueJoin
+        self.joinComparisons = 0
+
+    def asDict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+# the one instance everything counts into
+counters = MergeCounters()
+
+class IterationStats:
+    def __init__(self, iteration, sizeBefore, sizeAfter, elapsed, counts,
+                 memoryCurrent = None, memoryPeak = None):
+        self.iteration = iteration
+        self.sizeBefore = sizeBefore
+        self.sizeAfter = sizeAfter
+        self.elapsed = elapsed
+        self.counts = counts
+        # bytes, only filled in with profile='tracemalloc'
+        self.memoryCurrent = memoryCurrent
+        self.memoryPeak = memoryPeak
+
+    def asDict(self):
+        d = {
+            'iteration': self.iteration,
+            'sizeBefore': self.sizeBefore,
+            'sizeAfter': self.sizeAfter,
+            'elapsed': self.elapsed,
+        }
+        d.update(self.counts)
+        if self.memoryPeak is not None:
+            d['memoryCurrent'] = self.memoryCurrent
+            d['memoryPeak'] = self.memoryPeak
+        return d
+
+class Progress:
+    # how far the merging got, handed to MergeObserver.onProgress
+    def __init__(self, iteration, startSize, size, elapsed, recentRate, timeLeft = None):
+        self.iteration = iteration
+        self.startSize = startSize
+        self.size = size
+        self.elapsed = elapsed
+        # rows removed per second since the start, and since the last report
+        self.rate = (startSize - size) / elapsed if elapsed > 0 else 0.0
+        self.recentRate = recentRate
+        # seconds of the budget left, None without a time budget
+        self.timeLeft = timeLeft
+
+    def reduction(self):
+        # fraction of the rows merged away so far
+        return 1 - self.size / self.startSize if self.startSize else 0.0
+
+class MergeObserver:
+    # base class, override what is needed
+    def onStart(self, size):
+        pass
+
+    def onIteration(self, stats):
+        pass
+
+    def onProgress(self, progress):
+        pass
+
+    def onCheckpoint(self, path, iteration, size):
+        pass
+
+    def onFinish(self, size, elapsed):
+        pass
+
+class PrintObserver(MergeObserver):
+    # what mergeFormulas used to print
+    def __init__(self, every = 1):
+        self.every = every
+
+    def onIteration(self, stats):
+        if stats.iteration % self.every != 0:
+            return
+        print("iter", stats.iteration, "List len before = ", stats.sizeBefore,
+              "List len after merging = ", stats.sizeAfter)
+
+class ProgressCallback(MergeObserver):
+    # calls fn(progress) on every progress report
+    def __init__(self, fn):
+        self.fn = fn
+
+    def onProgress(self, progress):
+        self.fn(progress)
+
+class ProgressPrinter(MergeObserver):
+    def onProgress(self, progress):
+        line = (f"iter {progress.iteration}: {progress.size} of {progress.startSize} rows "
+                f"({progress.reduction():.1%} merged), {progress.rate:.1f} rows/s, "
+                f"recently {progress.recentRate:.1f} rows/s")
+        if progress.timeLeft is not None:
+            line += f", {max(progress.timeLeft, 0):.0f} s left"
+        print(line)
+
+    def onCheckpoint(self, path, iteration, size):
+        print(f"checkpoint at iter {iteration}, {size} rows, saved to {path}")
+
+class TraceObserver(MergeObserver):
+    # writes one json object per line: a start record, the iterations, a finish record
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def _write(self, record):
+        self.file.write(json.dumps(record) + "\n")
+
+    def onStart(self, size):
+        self.file = open(self.path, "w")
+        self._write({'event': 'start', 'size': size, 'time': time.time()})
+
+    def onIteration(self, stats):
+        record = {'event': 'iteration'}
+        record.update(stats.asDict())
+        self._write(record)
+
+    def onFinish(self, size, elapsed):
+        self._write({'event': 'finish', 'size': size, 'elapsed': elapsed})
+        self.file.close()
+        self.file = None
+
+class CollectObserver(MergeObserver):
+    # keeps every IterationStats in memory
+    def __init__(self):
+        self.iterations = []
+
+    def onIteration(self, stats):
+        self.iterations.append(stats)
+
+def readTrace(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def plotTrace(path, imageFile, field = 'sizeAfter'):
+    # plots one field of a trace per iteration, like the pictures in results/
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    records = [r for r in readTrace(path) if r['event'] == 'iteration']
+    plt.figure()
+    plt.plot([r['iteration'] for r in records], [r[field] for r in records])
+    plt.xlabel('iteration')
+    plt.ylabel(field)
+    plt.savefig(imageFile)
+    plt.close()
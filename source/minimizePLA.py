@@ -1,31 +1,39 @@
+import sys
+
 from espresso_func import minimize
+from pipeline import boardFile
+from result_cache import ResultCache
 import time
 
-def countLines():
+def countLines(fileName):
     numLines = 0
-    with open(GENERATED_PLA, 'r') as f:
+    with open(fileName, 'r') as f:
         for _, _ in enumerate(f):
             numLines += 1
     numSkipLines = 5
     numLines -= numSkipLines
     return numLines
 
-BOARD_SIZE = 3
-GENERATED_PLA = f"original{BOARD_SIZE}x{BOARD_SIZE}.pla"
+# board size from the command line, 3 by default
+boardSize = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+GENERATED_PLA = boardFile("original", boardSize, ".pla")
 print(f"Minimizing {GENERATED_PLA} file...")
-MINIMIZED_OUTPUT_FILE = f"minimized{BOARD_SIZE}x{BOARD_SIZE}.pla"
+MINIMIZED_OUTPUT_FILE = boardFile("minimized", boardSize, ".pla")
 
 print('conuting lines...')
-numLines = countLines()
+numLines = countLines(GENERATED_PLA)
 print('Minimizing...')
 start = time.time()
-minimize(GENERATED_PLA, MINIMIZED_OUTPUT_FILE)
+# non-zero when espresso failed or the result did not check out, and
+# then nothing was written
+status = minimize(GENERATED_PLA, MINIMIZED_OUTPUT_FILE, cache=ResultCache())
 end = time.time()
+if status:
+    print(f"Minimizing {GENERATED_PLA} failed, {MINIMIZED_OUTPUT_FILE} not written.")
+    sys.exit(1)
 
 timeLength = end - start
-RUN_TIMES_FILE = "run_time_length.txt"
-with open(RUN_TIMES_FILE, "a") as f:
-    f.write(f"{numLines} lines, {timeLength}\n")
+# timings are recorded with benchmark.py now
+print(f"{numLines} lines, {timeLength}")
 print("Time elpassed = ", timeLength)
 print(f"Finished!, file saved as {MINIMIZED_OUTPUT_FILE}.")
-
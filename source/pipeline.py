@@ -0,0 +1,298 @@
+# batch runs of the main_minimizer pipeline:
+# read -> encode -> filter -> minimize -> export, for a list of jobs.
+# a JobConfig holds everything a run depends on (board size, strategy
+# table, filter, minimizer, exports, output directory), so jobs share no
+# state and runBatch can run them side by side in a process pool. every
+# job writes into its own directory and prints into its own log, and a
+# summary table of the timings and cube counts is printed at the end
+import argparse
+import contextlib
+import itertools
+import os
+import sys
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+
+import table_loader
+from main_minimizer import (DEFAULT_BOARD_SIZE, goIntoScriptDir, inputTableFile,
+                            mergeFormulasByOutput, partitionByOutput, tableToPla, writeCsv)
+
+# the tables tableGen writes: chessStrategy{n}x{n}.txt and chessDict{n}x{n}.txt
+STRATEGIES = ('Strategy', 'Dict')
+MINIMIZERS = ('merge', 'espresso', 'none')
+EXPORTS = ('csv', 'columnar', 'pla')
+STAGES = ('read', 'filter', 'encode', 'minimize', 'export')
+
+DEFAULT_BATCH_DIR = 'results/batch'
+
+def boardFile(prefix, boardSize, extension):
+    # the file names main_minimizer uses, like original4x4.csv
+    return f"{prefix}{boardSize}x{boardSize}{extension}"
+
+class JobConfig:
+    # one run of the pipeline.
+    #   strategy    'Strategy' or 'Dict', picks the tableGen table
+    #   byKey, byValue  bit_filter patterns for the rows to minimize
+    #   minimizer   'merge' (mergeFormulasByOutput), 'espresso' or 'none'
+    #   exports     of EXPORTS: 'csv' of the whole table, 'columnar' the
+    #               same csv plus table_export's columnar file, 'pla' the
+    #               filtered rows and, with espresso, the minimized cover
+    #   mergeWorkers  processes for mergeFormulasByOutput, 1 runs inline
+    #   logFile     print into this file instead of stdout
+    def __init__(self, boardSize = DEFAULT_BOARD_SIZE, strategy = 'Strategy', byKey = None,
+                 byValue = None, minimizer = 'merge', useFaster = True, backend = 'python',
+                 espressoConfig = None, exports = ('csv',), outputDir = '', name = None,
+                 cache = True, verify = True, mergeWorkers = None, logFile = None):
+        # raises for boards above 8
+        table_loader.posBitLen(boardSize)
+        if strategy not in STRATEGIES:
+            raise ValueError(f"Unknown strategy {strategy!r}, expected one of {STRATEGIES}")
+        if minimizer not in MINIMIZERS:
+            raise ValueError(f"Unknown minimizer {minimizer!r}, expected one of {MINIMIZERS}")
+        unknown = set(exports) - set(EXPORTS)
+        if unknown:
+            raise ValueError(f"Unknown exports {sorted(unknown)}, expected some of {EXPORTS}")
+        self.boardSize = boardSize
+        self.strategy = strategy
+        self.byKey = byKey
+        self.byValue = byValue
+        self.minimizer = minimizer
+        self.useFaster = useFaster
+        self.backend = backend
+        self.espressoConfig = espressoConfig
+        self.exports = tuple(exports)
+        self.outputDir = outputDir
+        self.name = name or boardFile(strategy.lower(), boardSize, '')
+        self.cache = cache
+        self.verify = verify
+        self.mergeWorkers = mergeWorkers
+        self.logFile = logFile
+
+    @property
+    def isOptimal(self):
+        return self.strategy == 'Dict'
+
+    @property
+    def keyBits(self):
+        return table_loader.keyLen(self.boardSize)
+
+    @property
+    def valBits(self):
+        return table_loader.valLen(self.boardSize)
+
+    def inputTableFile(self):
+        return inputTableFile(self.isOptimal, self.boardSize)
+
+    def outputFile(self, prefix, extension):
+        return os.path.join(self.outputDir, boardFile(prefix, self.boardSize, extension))
+
+    def filterText(self):
+        return f"{self.byKey or '*'}/{self.byValue or '*'}"
+
+def _minimizeMerge(config, filteredLookup, cache):
+    merged = mergeFormulasByOutput(filteredLookup, config.useFaster, config.backend,
+                                   cache=cache, workers=config.mergeWorkers)
+    cubes = sum(len(formulas) for formulas in merged.values())
+    wrong = None
+    if config.verify:
+        # merging blocks of different bits is not exact, so only report it
+        from equivalence import verify_formulas
+        partitions = partitionByOutput(filteredLookup)
+        wrong = sum(verify_formulas(merged[val], rows)['mismatches']
+                    for val, rows in partitions.items())
+        print(f"{wrong} keys wrong after merging, over {len(partitions)} moves")
+    return cubes, wrong, None
+
+def _minimizeEspresso(config, filteredLookup, cache):
+    from espresso_func import minimize_cover
+    cubes = minimize_cover(config.keyBits, config.valBits, filteredLookup,
+                           config.espressoConfig, cache=cache)
+    wrong = None
+    if config.verify:
+        # espresso is exact, any mismatch is a bug: raises EquivalenceError,
+        # which fails the job before the cover is written
+        from equivalence import check_cover
+        check_cover(cubes, filteredLookup)
+        wrong = 0
+    print(f"espresso: {len(filteredLookup)} rows -> {len(cubes)} cubes")
+    return len(cubes), wrong, cubes
+
+def runJob(config):
+    # runs the pipeline for one JobConfig, returns its record: counts and
+    # the seconds of every stage
+    from binary_table import loadOrConvert
+    from bit_filter import selectMask
+    from result_cache import ResultCache
+    from table_loader import toBitLookup
+
+    record = {'job': config.name, 'board': config.boardSize, 'strategy': config.strategy,
+              'filter': config.filterText(), 'minimizer': config.minimizer,
+              'status': 'done', 'rows': None, 'filtered': None, 'cubes': None,
+              'wrong': None, 'seconds': {}}
+    seconds = record['seconds']
+    start = time.perf_counter()
+
+    def stage(name):
+        nonlocal start
+        now = time.perf_counter()
+        seconds[name] = now - start
+        start = now
+
+    if config.outputDir:
+        os.makedirs(config.outputDir, exist_ok=True)
+    # same table as readInputFile + convertToBits, kept in a memory-mapped
+    # binary file next to the text one
+    table = loadOrConvert(config.inputTableFile(), config.boardSize)
+    record['rows'] = len(table)
+    print('before minimization length = ', len(table))
+    print('Key length = ', table.keyBits, 'Value length = ', table.valBits)
+    stage('read')
+
+    selected = selectMask(table.keys, table.values, table.keyBits, table.valBits,
+                          byKey=config.byKey, byValue=config.byValue)
+    stage('filter')
+
+    # only the filtered rows are turned into strings
+    filteredLookup = toBitLookup(table.keys[selected].astype('uint64'),
+                                 table.values[selected].astype('uint64'), config.boardSize)
+    record['filtered'] = len(filteredLookup)
+    print("Filtered length = ", len(filteredLookup))
+    stage('encode')
+
+    minimized = None
+    if config.minimizer != 'none' and filteredLookup:
+        cache = ResultCache() if config.cache else None
+        minimize = _minimizeMerge if config.minimizer == 'merge' else _minimizeEspresso
+        record['cubes'], record['wrong'], minimized = minimize(config, filteredLookup, cache)
+    stage('minimize')
+
+    if 'csv' in config.exports or 'columnar' in config.exports:
+        writeCsv((table.keys.astype('uint64'), table.values.astype('uint64')),
+                 'bits' if 'columnar' in config.exports else None, config.boardSize,
+                 config.outputFile('original', ''))
+    if 'pla' in config.exports and filteredLookup:
+        tableToPla(filteredLookup, config.outputFile('original', '.pla'), config.boardSize)
+        if minimized is not None:
+            from espresso_func import write_pla
+            write_pla(config.outputFile('minimized', '.pla'), config.keyBits,
+                      config.valBits, minimized)
+    stage('export')
+    return record
+
+def _runLogged(config):
+    # runs in a pool worker: failures end up in the record, and the prints
+    # of the job in its log file
+    start = time.perf_counter()
+    try:
+        if config.logFile is None:
+            return runJob(config)
+        os.makedirs(os.path.dirname(os.path.abspath(config.logFile)), exist_ok=True)
+        with open(config.logFile, 'w') as log, contextlib.redirect_stdout(log):
+            try:
+                return runJob(config)
+            except Exception:
+                traceback.print_exc(file=log)
+                raise
+    except Exception as exc:
+        return {'job': config.name, 'board': config.boardSize, 'strategy': config.strategy,
+                'filter': config.filterText(), 'minimizer': config.minimizer,
+                'status': 'failed', 'error': f"{type(exc).__name__}: {exc}",
+                'rows': None, 'filtered': None, 'cubes': None, 'wrong': None,
+                'seconds': {'total': time.perf_counter() - start}}
+
+def runBatch(configs, workers = None, batchDir = DEFAULT_BATCH_DIR):
+    # runs every JobConfig in a process pool, returns their records in the
+    # order of configs. jobs without an output directory or log file get
+    # batchDir/<name>/ and batchDir/<name>/<name>.log
+    configs = list(configs)
+    names = [config.name for config in configs]
+    repeated = sorted({name for name in names if names.count(name) > 1})
+    if repeated:
+        raise ValueError(f"Job names have to be unique, repeated: {repeated}")
+    for config in configs:
+        if not config.outputDir:
+            config.outputDir = os.path.join(batchDir, config.name)
+        if config.logFile is None:
+            config.logFile = os.path.join(config.outputDir, config.name + '.log')
+
+    start = time.perf_counter()
+    if workers == 1:
+        records = list(map(_runLogged, configs))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            records = list(pool.map(_runLogged, configs))
+    printSummary(records, time.perf_counter() - start)
+    return records
+
+def _cell(value, digits = None):
+    if value is None:
+        return ''
+    return f"{value:.{digits}f}" if digits is not None else str(value)
+
+def printSummary(records, wallSeconds = None):
+    columns = ['job', 'status', 'rows', 'filtered', 'cubes', 'wrong'] + list(STAGES) + ['total']
+    rows = []
+    for r in records:
+        seconds = r['seconds']
+        total = seconds.get('total', sum(seconds.values()))
+        rows.append([r['job'], r['status'], _cell(r['rows']), _cell(r['filtered']),
+                     _cell(r['cubes']), _cell(r['wrong'])]
+                    + [_cell(seconds.get(s), 3) for s in STAGES] + [_cell(total, 3)])
+    widths = [max(len(c), *(len(row[i]) for row in rows)) if rows else len(c)
+              for i, c in enumerate(columns)]
+    print("  ".join(c.ljust(w) if i < 2 else c.rjust(w)
+                    for i, (c, w) in enumerate(zip(columns, widths))))
+    for row in rows:
+        print("  ".join(c.ljust(w) if i < 2 else c.rjust(w)
+                        for i, (c, w) in enumerate(zip(row, widths))))
+    for r in records:
+        if r['status'] == 'failed':
+            print(f"{r['job']}: {r['error']}")
+    if wallSeconds is not None:
+        print(f"{len(records)} jobs in {wallSeconds:.2f} s")
+
+
+PARSER = argparse.ArgumentParser(
+    description="Run the minimizer pipeline for several board sizes, strategies and filters")
+PARSER.add_argument('--boards', type=int, nargs='+', default=[DEFAULT_BOARD_SIZE])
+PARSER.add_argument('--strategies', nargs='+', choices=STRATEGIES, default=['Strategy'])
+PARSER.add_argument('--filter', action='append', metavar='KEY/VALUE', default=None,
+                    help=("bit_filter patterns for the keys and the values, like "
+                          "0..0......../ ; either side may be empty. repeat for more jobs"))
+PARSER.add_argument('--minimizer', choices=MINIMIZERS, default='merge')
+PARSER.add_argument('--exports', nargs='*', choices=EXPORTS, default=[])
+PARSER.add_argument('--workers', type=int, default=None,
+                    help="jobs run at once (default: CPU count)")
+PARSER.add_argument('--merge-workers', type=int, default=1,
+                    help="processes of each job's mergeFormulasByOutput (default: 1)")
+PARSER.add_argument('--output', default=DEFAULT_BATCH_DIR,
+                    help=f"directory for the job directories (default: {DEFAULT_BATCH_DIR})")
+PARSER.add_argument('--no-cache', action='store_false', dest='cache')
+
+def jobsFromArgs(opts):
+    filters = [(None, None)]
+    if opts.filter:
+        filters = []
+        for f in opts.filter:
+            byKey, _, byValue = f.partition('/')
+            filters.append((byKey or None, byValue or None))
+    configs = []
+    for boardSize, strategy, (i, (byKey, byValue)) in itertools.product(
+            opts.boards, opts.strategies, enumerate(filters)):
+        name = boardFile(strategy.lower(), boardSize, '')
+        if len(filters) > 1:
+            name += f"-f{i}"
+        configs.append(JobConfig(boardSize, strategy, byKey, byValue, opts.minimizer,
+                                 exports=opts.exports, name=name, cache=opts.cache,
+                                 mergeWorkers=opts.merge_workers))
+    return configs
+
+def main(argv = None):
+    opts = PARSER.parse_args(argv)
+    goIntoScriptDir()
+    records = runBatch(jobsFromArgs(opts), opts.workers, opts.output)
+    return 1 if any(r['status'] == 'failed' for r in records) else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
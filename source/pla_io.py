@@ -0,0 +1,405 @@
+"""\
+Bulk reading and writing of PLA files.
+
+Cubes are handled as two uint8 matrices of their characters, one row
+per cube: the inputs, (cubes, ninputs), and the outputs, (cubes,
+noutputs). Converting such a matrix to and from PLA text is a single
+array operation over all its rows, and pack_symbols turns it into the
+integer masks of cover_eval, where the first character of a string is
+the most significant bit.
+
+PlaReader parses a file a block of lines at a time. Cube lines of the
+usual form, inputs, one space and outputs, are cut out of the block
+together; only directives, comments and cubes spaced otherwise are
+parsed line by line. read_pla returns the same dict as pyeda's
+pla.parse, with the cover as (input, output) strings.
+"""
+
+import re
+import sys
+import time
+from collections import namedtuple
+
+import numpy as np
+
+
+# bytes read at once by PlaReader, rounded to whole lines
+CHUNK_BYTES = 1 << 22
+# cubes formatted at once by write_pla
+CHUNK_ROWS = 1 << 16
+
+# cover types, with the values of pyeda.boolalg.espresso
+FTYPE = 1
+DTYPE = 2
+RTYPE = 4
+TYPES = {
+    "f": FTYPE,
+    "r": RTYPE,
+    "fd": FTYPE | DTYPE,
+    "fr": FTYPE | RTYPE,
+    "dr": DTYPE | RTYPE,
+    "fdr": FTYPE | DTYPE | RTYPE,
+}
+TYPE_NAMES = {code: name for name, code in TYPES.items()}
+
+_NINS = re.compile(r"^.i\s+(\d+)$")
+_NOUTS = re.compile(r"^.o\s+(\d+)$")
+_PROD = re.compile(r"^.p\s+(\d+)$")
+_ILB = re.compile(r"^.ilb\s+(\w+(?:\s+\w+)*)$")
+_OB = re.compile(r"^.ob\s+(\w+(?:\s+\w+)*)$")
+_TYPE = re.compile(r"^.type\s+(f|r|fd|fr|dr|fdr)$")
+_CUBE = re.compile(r"^([01-]+)\s+([01-]+)$")
+_END = re.compile(r"^.e(?:nd)?$")
+
+ZERO, ONE, DASH, SPACE, NEWLINE = (ord(c) for c in "01- \n")
+CUBE_CHARS = np.frombuffer(b"01-", dtype=np.uint8)
+IS_CUBE_CHAR = np.zeros(256, dtype=bool)
+IS_CUBE_CHAR[CUBE_CHARS] = True
+
+# pyeda's cube encoding: inputs 1, 2, 3 and outputs 0, 1, 2 for '0', '1', '-'
+PYEDA_INPUT_CHARS = np.frombuffer(b"?01-", dtype=np.uint8)
+PYEDA_OUTPUT_CHARS = np.frombuffer(b"01-", dtype=np.uint8)
+PYEDA_INPUT_CODES = np.zeros(256, dtype=np.uint8)
+PYEDA_INPUT_CODES[[ZERO, ONE, DASH]] = [1, 2, 3]
+PYEDA_OUTPUT_CODES = np.zeros(256, dtype=np.uint8)
+PYEDA_OUTPUT_CODES[[ZERO, ONE, DASH]] = [0, 1, 2]
+
+
+class PlaError(ValueError):
+    """A PLA file could not be parsed."""
+
+
+PackedCubes = namedtuple('PackedCubes',
+                         'in_mask in_value out_mask out_value ninputs noutputs')
+PackedCubes.__doc__ = """\
+Cubes as uint64 arrays: in_mask has the bits of the inputs that are not
+'-' and in_value those that are '1', out_mask and out_value the same for
+the outputs.
+"""
+
+
+def _symbols(strings, count, width):
+    data = "".join(strings).encode("ascii")
+    if len(data) != count * width:
+        raise ValueError(f"cubes are not all {width} characters wide")
+    return np.frombuffer(data, dtype=np.uint8).reshape(count, width)
+
+def cube_symbols(cubes):
+    """Return the (inputs, outputs) character matrices of a cover.
+
+    cubes is a list of (input, output) strings or a dict mapping input
+    strings to output strings, like main_minimizer.bitLookup.
+    """
+    if isinstance(cubes, dict):
+        cubes = cubes.items()
+    cubes = list(cubes)
+    if not cubes:
+        return np.zeros((0, 0), dtype=np.uint8), np.zeros((0, 0), dtype=np.uint8)
+    ninputs, noutputs = len(cubes[0][0]), len(cubes[0][1])
+    return (_symbols((invec for invec, _ in cubes), len(cubes), ninputs),
+            _symbols((outvec for _, outvec in cubes), len(cubes), noutputs))
+
+def _strings(symbols):
+    count, width = symbols.shape
+    if width == 0:
+        return [""] * count
+    lines = np.empty((count, width + 1), dtype=np.uint8)
+    lines[:, :width] = symbols
+    lines[:, width] = NEWLINE
+    return lines.tobytes().decode("ascii").split("\n")[:-1]
+
+def cube_strings(inputs, outputs):
+    """Return the (input, output) strings of two character matrices."""
+    return list(zip(_strings(inputs), _strings(outputs)))
+
+def format_cubes(inputs, outputs):
+    """PLA text of the cubes, one "inputs outputs" line each, as bytes."""
+    count, ninputs = inputs.shape
+    noutputs = outputs.shape[1]
+    text = np.empty((count, ninputs + noutputs + 2), dtype=np.uint8)
+    text[:, :ninputs] = inputs
+    text[:, ninputs] = SPACE
+    text[:, ninputs + 1:-1] = outputs
+    text[:, -1] = NEWLINE
+    return text.tobytes()
+
+def _pack(symbols, width):
+    if width > 64:
+        raise ValueError(f"{width} columns do not fit into uint64 masks")
+    mask = np.zeros(len(symbols), dtype=np.uint64)
+    value = np.zeros(len(symbols), dtype=np.uint64)
+    one = np.uint64(1)
+    for col in range(width):
+        mask = (mask << one) | (symbols[:, col] != DASH)
+        value = (value << one) | (symbols[:, col] == ONE)
+    return mask, value
+
+def pack_symbols(inputs, outputs):
+    """Turn character matrices into PackedCubes."""
+    ninputs, noutputs = inputs.shape[1], outputs.shape[1]
+    return PackedCubes(*_pack(inputs, ninputs), *_pack(outputs, noutputs),
+                       ninputs, noutputs)
+
+def pack_cubes(cubes):
+    """PackedCubes of a list or dict of (input, output) strings."""
+    return pack_symbols(*cube_symbols(cubes))
+
+def _unpack(mask, value, width):
+    shifts = np.arange(width - 1, -1, -1, dtype=np.uint64)
+    one = np.uint64(1)
+    care = (np.asarray(mask, dtype=np.uint64)[:, None] >> shifts) & one
+    ones = (np.asarray(value, dtype=np.uint64)[:, None] >> shifts) & one
+    return np.where(care == 1, np.where(ones == 1, ONE, ZERO), DASH).astype(np.uint8)
+
+def unpack_symbols(packed):
+    """The (inputs, outputs) character matrices of PackedCubes."""
+    return (_unpack(packed.in_mask, packed.in_value, packed.ninputs),
+            _unpack(packed.out_mask, packed.out_value, packed.noutputs))
+
+def table_cubes(keys, values, ninputs, noutputs):
+    """PackedCubes of a table of packed keys and values, one minterm each."""
+    keys = np.asarray(keys, dtype=np.uint64)
+    values = np.asarray(values, dtype=np.uint64)
+    return PackedCubes(np.full(len(keys), np.uint64((1 << ninputs) - 1)), keys,
+                       np.full(len(values), np.uint64((1 << noutputs) - 1)), values,
+                       ninputs, noutputs)
+
+def decode_pyeda(cover):
+    """Character matrices of a cover in pyeda's tuple encoding."""
+    cover = list(cover)
+    if not cover:
+        return np.zeros((0, 0), dtype=np.uint8), np.zeros((0, 0), dtype=np.uint8)
+    inputs = np.array([invec for invec, _ in cover], dtype=np.uint8)
+    outputs = np.array([outvec for _, outvec in cover], dtype=np.uint8)
+    return PYEDA_INPUT_CHARS[inputs], PYEDA_OUTPUT_CHARS[outputs]
+
+def encode_pyeda(inputs, outputs):
+    """The set of pyeda cube tuples of two character matrices."""
+    return set(zip(map(tuple, PYEDA_INPUT_CODES[inputs].tolist()),
+                   map(tuple, PYEDA_OUTPUT_CODES[outputs].tolist())))
+
+
+def _cut(text, starts, width):
+    # rows of width characters at starts, a view when they follow each
+    # other line by line
+    first = int(starts[0]) if len(starts) else 0
+    if np.array_equal(starts, first + (width + 1) * np.arange(len(starts))):
+        return text[first:first + (width + 1) * len(starts)].reshape(-1, width + 1)[:, :width]
+    return np.lib.stride_tricks.sliding_window_view(text, width)[starts]
+
+
+class PlaReader:
+    """Parse a PLA file incrementally.
+
+    Iterating yields the cubes as (inputs, outputs) character matrices,
+    one pair per block of the file, in file order. header has the keys of
+    pla.parse but cover, and is complete once the iteration is done.
+    """
+
+    def __init__(self, path, chunk_bytes=CHUNK_BYTES):
+        self.path = path
+        self.chunk_bytes = chunk_bytes
+        self.header = dict(ninputs=None, noutputs=None, input_labels=None,
+                           output_labels=None, intype=None)
+        self.lines = 0
+
+    def __iter__(self):
+        with open(self.path, "rb") as f:
+            rest = b""
+            while True:
+                data = f.read(self.chunk_bytes)
+                if not data:
+                    break
+                data = rest + data
+                cut = data.rfind(b"\n") + 1
+                rest = data[cut:]
+                if cut:
+                    block = self._block(data[:cut])
+                    if block is not None:
+                        yield block
+            if rest:
+                block = self._block(rest + b"\n")
+                if block is not None:
+                    yield block
+
+    def _set(self, key, value, name):
+        if self.header[key] is not None:
+            raise PlaError(f"{name} declared more than once")
+        self.header[key] = value
+
+    def _line(self, number, line):
+        # a directive is applied to the header, a cube is returned as strings
+        line = line.strip()
+        if not line or line.startswith("#"):
+            return None
+        m = _CUBE.match(line)
+        if m:
+            return m.groups()
+        m = _NINS.match(line)
+        if m:
+            self._set("ninputs", int(m.group(1)), ".i")
+        elif _NOUTS.match(line):
+            self._set("noutputs", int(_NOUTS.match(line).group(1)), ".o")
+        elif _ILB.match(line):
+            self._set("input_labels", _ILB.match(line).group(1).split(), ".ilb")
+        elif _OB.match(line):
+            self._set("output_labels", _OB.match(line).group(1).split(), ".ob")
+        elif _TYPE.match(line):
+            self._set("intype", TYPES[_TYPE.match(line).group(1)], ".type")
+        elif not (_PROD.match(line) or _END.match(line)):
+            raise PlaError(f"syntax error on line {number}: {line}")
+        return None
+
+    def _block(self, data):
+        # data holds whole lines, each ending in '\n'
+        first_line = self.lines
+        text = np.frombuffer(data, dtype=np.uint8)
+        ends = np.flatnonzero(text == NEWLINE)
+        starts = np.concatenate(([0], ends[:-1] + 1))
+        self.lines += len(ends)
+
+        # lines starting with a cube character are cut out of text below,
+        # the others are parsed one by one first, so that .i and .o are known
+        candidate = (ends > starts) & IS_CUBE_CHAR[text[np.minimum(starts, len(text) - 1)]]
+        slow = {}
+        for i in np.flatnonzero(~candidate).tolist():
+            cube = self._line(first_line + i + 1, data[starts[i]:ends[i]].decode())
+            if cube is not None:
+                slow[i] = cube
+
+        rows = np.flatnonzero(candidate)
+        if self.header["ninputs"] is None or self.header["noutputs"] is None:
+            sample = next(iter(slow.values()), None)
+            if sample is None and len(rows):
+                i = int(rows[0])
+                sample = self._line(first_line + i + 1, data[starts[i]:ends[i]].decode())
+            if sample is None:
+                return None
+            if self.header["ninputs"] is None:
+                self.header["ninputs"] = len(sample[0])
+            if self.header["noutputs"] is None:
+                self.header["noutputs"] = len(sample[1])
+        ninputs, noutputs = self.header["ninputs"], self.header["noutputs"]
+        width = ninputs + 1 + noutputs
+
+        # usual lines: width characters, maybe '\r', with the space after the inputs
+        lengths = ends[rows] - starts[rows]
+        lengths -= (lengths > width) & (text[ends[rows] - 1] == ord("\r"))
+        usual = lengths == width
+        usual[usual] = text[starts[rows[usual]] + ninputs] == SPACE
+        fast = rows[usual]
+        symbols = _cut(text, starts[fast], width)
+        inputs, outputs = symbols[:, :ninputs], symbols[:, ninputs + 1:]
+        valid = ((symbols | 1) == ONE) | (symbols == DASH)
+        valid[:, ninputs] = True
+        bad = ~valid.all(axis=1)
+        if bad.any():
+            i = int(fast[np.argmax(bad)])
+            raise PlaError(f"syntax error on line {first_line + i + 1}: "
+                           f"{data[starts[i]:ends[i]].decode().strip()}")
+        for i in rows[~usual].tolist():
+            cube = self._line(first_line + i + 1, data[starts[i]:ends[i]].decode())
+            if cube is not None:
+                slow[i] = cube
+
+        if not slow:
+            return (inputs, outputs) if len(fast) else None
+        for i, (invec, outvec) in slow.items():
+            if len(invec) != ninputs or len(outvec) != noutputs:
+                raise PlaError(f"line {first_line + i + 1}: cube is not "
+                               f"{ninputs} inputs and {noutputs} outputs wide")
+        order = np.argsort(np.concatenate((fast, list(slow))), kind="stable")
+        inputs = np.concatenate((inputs, _symbols((c[0] for c in slow.values()),
+                                                  len(slow), ninputs)))
+        outputs = np.concatenate((outputs, _symbols((c[1] for c in slow.values()),
+                                                    len(slow), noutputs)))
+        return inputs[order], outputs[order]
+
+    def symbols(self):
+        """All cubes of the file as one (inputs, outputs) pair."""
+        blocks = list(self)
+        ninputs = self.header["ninputs"] or 0
+        noutputs = self.header["noutputs"] or 0
+        if not blocks:
+            return (np.zeros((0, ninputs), dtype=np.uint8),
+                    np.zeros((0, noutputs), dtype=np.uint8))
+        return (np.concatenate([inputs for inputs, _ in blocks]),
+                np.concatenate([outputs for _, outputs in blocks]))
+
+
+def read_pla(fin, chunk_bytes=CHUNK_BYTES):
+    """Parse a PLA file into the dict of pyeda's pla.parse.
+
+    The cover is a list of (input, output) strings in file order, without
+    repeated cubes. Without .i or .o, the widths of the first cube are
+    taken instead of None.
+    """
+    reader = PlaReader(fin, chunk_bytes)
+    inputs, outputs = reader.symbols()
+    return dict(reader.header, cover=list(dict.fromkeys(cube_strings(inputs, outputs))))
+
+def write_pla(fout, ninputs, noutputs, cubes, input_labels=None,
+              output_labels=None, intype=None, chunk_rows=CHUNK_ROWS):
+    """Write cubes as a PLA file.
+
+    cubes is a list or dict of (input, output) strings, PackedCubes or an
+    (inputs, outputs) pair of character matrices. intype, a pyeda type
+    code such as FTYPE | RTYPE, adds a .type line.
+    """
+    if isinstance(cubes, PackedCubes):
+        count = len(cubes.in_mask)
+    elif isinstance(cubes, tuple):
+        count = len(cubes[0])
+    else:
+        cubes = cube_symbols(cubes)
+        count = len(cubes[0])
+    header = [f".i {ninputs}", f".o {noutputs}"]
+    if input_labels:
+        header.append(".ilb " + " ".join(input_labels))
+    if output_labels:
+        header.append(".ob " + " ".join(output_labels))
+    header.append(f".p {count}")
+    if intype is not None:
+        header.append(".type " + TYPE_NAMES[intype])
+    with open(fout, "wb") as f:
+        f.write(("\n".join(header) + "\n").encode("ascii"))
+        for start in range(0, count, chunk_rows):
+            if isinstance(cubes, PackedCubes):
+                part = unpack_symbols(PackedCubes(
+                    *(a[start:start + chunk_rows] for a in cubes[:4]), ninputs, noutputs))
+            else:
+                part = (cubes[0][start:start + chunk_rows],
+                        cubes[1][start:start + chunk_rows])
+            f.write(format_cubes(*part))
+        f.write(b".e\n")
+
+
+def benchmark(path="pla_io_benchmark.pla", cubes=100000, ninputs=18, noutputs=14,
+              seed=0):
+    """Time writing and reading a random cover of the given size."""
+    import os
+
+    rng = np.random.default_rng(seed)
+    inputs = CUBE_CHARS[rng.integers(0, 3, (cubes, ninputs))]
+    outputs = CUBE_CHARS[rng.integers(0, 2, (cubes, noutputs))]
+    pairs = cube_strings(inputs, outputs)
+    report = {}
+    try:
+        for name, func in (
+                ('write strings', lambda: write_pla(path, ninputs, noutputs, pairs)),
+                ('write arrays', lambda: write_pla(path, ninputs, noutputs, (inputs, outputs))),
+                ('read arrays', lambda: PlaReader(path).symbols()),
+                ('read strings', lambda: read_pla(path))):
+            start = time.perf_counter()
+            func()
+            report[name] = time.perf_counter() - start
+            print(f"{name:14} {cubes} cubes: {report[name] * 1000:8.1f} ms")
+        if read_pla(path)['cover'] != list(dict.fromkeys(pairs)):
+            raise AssertionError("read_pla does not give back the cubes written")
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    return report
+
+if __name__ == '__main__':
+    benchmark(cubes=int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
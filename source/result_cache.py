@@ -0,0 +1,106 @@
+"""\
+Content-addressed on-disk cache for minimization results.
+
+Entries are keyed by a hash of the normalized cover together with the
+options that produced the result (espresso settings or merge strategy).
+The least recently used entries are evicted once the cache grows past
+its size limit.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+DEFAULT_DIRECTORY = ".minimize_cache"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+SUFFIX = ".pickle"
+
+
+def cache_key(kind, rows, options, ordered=False):
+    """Hash rows (any iterable of strings) and options into a cache key.
+
+    Rows are sorted and deduplicated first, so the same table gives the
+    same key no matter how it was ordered. With ordered=True they are
+    hashed as given, for results that depend on the row order, such as
+    the greedy pairing of mergeFormulas.
+    """
+    h = hashlib.sha256()
+    h.update(kind.encode())
+    h.update(b"\0")
+    h.update(repr(sorted(options.items())).encode())
+    if ordered:
+        h.update(b"\0ordered")
+    for row in (rows if ordered else sorted(set(rows))):
+        h.update(b"\n")
+        h.update(row.encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    def __init__(self, directory=DEFAULT_DIRECTORY, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + SUFFIX)
+
+    def get(self, key):
+        """Return the cached value, or None on a miss or an unreadable entry."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                value = pickle.load(f)
+        except Exception:
+            return None
+        # mark as recently used
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))
+        finally:
+            # still there only if writing or renaming it failed
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        self.evict()
+
+    def entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(SUFFIX):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, name))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits max_bytes."""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+
+    def clear(self):
+        for _, _, name in self.entries():
+            os.remove(os.path.join(self.directory, name))
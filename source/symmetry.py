@@ -0,0 +1,176 @@
+# board symmetry reduction, the python side of ReflectX/ReflectY/ReflectD
+# and the Canonical* predicates of tableGen/nxn.c.
+# every position is mapped to a canonical representative under the 8
+# symmetries of the square board, together with its move, so the table to
+# minimize is up to 8 times smaller. SymmetricPolicy answers queries for any
+# position by canonicalizing it, looking it up and transforming the move back
+import numpy as np
+
+import table_loader
+from table_loader import BKx, BKy, WKx, WKy, WRx, WRy, UDLR_BITS
+
+# a transform is a 3 bit number: bit 2 swaps x and y (ReflectD), then bit 0
+# mirrors x (ReflectX) and bit 1 mirrors y (ReflectY)
+NUM_TRANSFORMS = 8
+SWAP = 4
+FLIP_X = 1
+FLIP_Y = 2
+
+PIECES = ((BKx, BKy), (WKx, WKy), (WRx, WRy))
+
+def transformCoords(x, y, t, boardSize):
+    if t & SWAP:
+        x, y = y, x
+    if t & FLIP_X:
+        x = boardSize - 1 - x
+    if t & FLIP_Y:
+        y = boardSize - 1 - y
+    return x, y
+
+def inverseCoords(x, y, t, boardSize):
+    if t & FLIP_X:
+        x = boardSize - 1 - x
+    if t & FLIP_Y:
+        y = boardSize - 1 - y
+    if t & SWAP:
+        x, y = y, x
+    return x, y
+
+def transformVector(dx, dy, t):
+    if t & SWAP:
+        dx, dy = dy, dx
+    if t & FLIP_X:
+        dx = -dx
+    if t & FLIP_Y:
+        dy = -dy
+    return dx, dy
+
+def inverseVector(dx, dy, t):
+    if t & FLIP_X:
+        dx = -dx
+    if t & FLIP_Y:
+        dy = -dy
+    if t & SWAP:
+        dx, dy = dy, dx
+    return dx, dy
+
+def transformRows(rows, t, boardSize):
+    # (n, 8) tableGen rows with every piece moved by transform t
+    out = rows.copy()
+    for xc, yc in PIECES:
+        out[:, xc], out[:, yc] = transformCoords(rows[:, xc], rows[:, yc], t, boardSize)
+    return out
+
+def canonicalTransforms(keys, boardSize):
+    # for each row the transform giving the smallest packed key, the
+    # smallest transform on ties
+    packed = np.stack([table_loader.encodeKeys(transformRows(keys, t, boardSize), boardSize)
+                       for t in range(NUM_TRANSFORMS)])
+    return packed.argmin(axis=0)
+
+def reduceTable(keys, values, boardSize):
+    # maps the (n, 8) key/value rows of table_loader.readTableArrays to their
+    # canonical representatives. returns the reduced (keys, values) and the
+    # number of positions whose transformed move disagrees with the move
+    # already stored for their representative; the representative keeps the
+    # move of the first such position
+    transforms = canonicalTransforms(keys, boardSize)
+    canonKeys = np.empty_like(keys)
+    canonValues = np.empty_like(values)
+    for t in range(NUM_TRANSFORMS):
+        rows = transforms == t
+        canonKeys[rows] = transformRows(keys[rows], t, boardSize)
+        canonValues[rows] = transformRows(values[rows], t, boardSize)
+
+    packed = table_loader.encodeKeys(canonKeys, boardSize)
+    _, first, inverse = np.unique(packed, return_index=True, return_inverse=True)
+    order = np.sort(first)
+    conflicts = int(np.any(canonValues != canonValues[first][inverse], axis=1).sum())
+    return canonKeys[order], canonValues[order], conflicts
+
+def reduceFile(path, boardSize):
+    # packed (keys, values) of the reduced table of a tableGen output
+    keys, values = table_loader.readTableArrays(path)
+    canonKeys, canonValues, conflicts = reduceTable(keys, values, boardSize)
+    print(f"{len(keys)} positions reduced to {len(canonKeys)}, {conflicts} with a conflicting move")
+    return table_loader.encodeTable(canonKeys, canonValues, boardSize)
+
+def _fields(boardSize):
+    posBits = table_loader.posBitLen(boardSize)
+    return posBits, 2 * posBits
+
+def decodeMove(value, boardSize):
+    # packed move bits -> (isKing, dx, dy), dx/dy being the move vector
+    posBits, distanceBits = _fields(boardSize)
+    king = value >> (UDLR_BITS + distanceBits)
+    rook = (value >> distanceBits) & 0xF
+    if king:
+        up, down, left, right = (king >> 3) & 1, (king >> 2) & 1, (king >> 1) & 1, king & 1
+        return True, right - left, up - down
+    up, down, left, right = (rook >> 3) & 1, (rook >> 2) & 1, (rook >> 1) & 1, rook & 1
+    distance = value & ((1 << distanceBits) - 1)
+    if up or down:
+        distance >>= posBits
+    else:
+        distance &= (1 << posBits) - 1
+    return False, (right - left) * distance, (up - down) * distance
+
+def encodeMove(isKing, dx, dy, boardSize):
+    # inverse of decodeMove, the same bits convertToBits writes
+    posBits, distanceBits = _fields(boardSize)
+    direction = (int(dy > 0) << 3) | (int(dy < 0) << 2) | (int(dx < 0) << 1) | int(dx > 0)
+    if isKing:
+        return direction << (UDLR_BITS + distanceBits)
+    distance = abs(dx) + abs(dy)
+    if dy != 0:
+        distance <<= posBits
+    return (direction << distanceBits) | distance
+
+def transformMove(value, t, boardSize, inverse = False):
+    isKing, dx, dy = decodeMove(value, boardSize)
+    dx, dy = inverseVector(dx, dy, t) if inverse else transformVector(dx, dy, t)
+    return encodeMove(isKing, dx, dy, boardSize)
+
+class SymmetricPolicy:
+    # answers move queries for any position from a table (or cover) that
+    # only knows canonical positions. lookup maps a packed canonical key to
+    # packed move bits, e.g. a dict's get or a cover evaluation
+    def __init__(self, lookup, boardSize):
+        self.lookup = lookup
+        self.boardSize = boardSize
+
+    def canonical(self, position):
+        # position: (BKx, BKy, WKx, WKy, WRx, WRy) -> (transform, packed key)
+        posBits = table_loader.posBitLen(self.boardSize)
+        best = None
+        for t in range(NUM_TRANSFORMS):
+            key = 0
+            for i in range(0, 6, 2):
+                x, y = transformCoords(position[i], position[i + 1], t, self.boardSize)
+                key = (((key << posBits) | x) << posBits) | y
+            if best is None or key < best[1]:
+                best = (t, key)
+        return best
+
+    def query(self, position):
+        # packed move bits for the position, None if the table has no move
+        t, key = self.canonical(position)
+        value = self.lookup(key)
+        if value is None:
+            return None
+        return transformMove(int(value), t, self.boardSize, inverse=True)
+
+def policyFromCover(cubes, boardSize):
+    # a SymmetricPolicy backed by a minimized cover of the reduced table
+    from cover_eval import CompiledCover
+    return SymmetricPolicy(CompiledCover(cubes).query, boardSize)
+
+def minimizeReduced(path, boardSize, config = None):
+    # minimizes the reduced table of a tableGen output with espresso,
+    # returns the cubes and a SymmetricPolicy answering from them
+    from espresso_func import minimize_cover
+    packedKeys, packedValues = reduceFile(path, boardSize)
+    table = table_loader.toBitLookup(packedKeys, packedValues, boardSize)
+    cubes = minimize_cover(table_loader.keyLen(boardSize), table_loader.valLen(boardSize),
+                           table, config)
+    return cubes, policyFromCover(cubes, boardSize)
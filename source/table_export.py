@@ -0,0 +1,155 @@
+# streaming export of packed tables (table_loader / binary_table).
+# the csv is the one the KNIME workflow in knime/chess reads: one column
+# per bit, holding NAME when the bit is set and ~NAME otherwise. it is
+# written in chunks of rows straight from the packed keys and values,
+# several bits at a time through precomputed strings.
+# the columnar file keeps one column per bit, in row groups: inside a row
+# group every column is a contiguous block, either packed 8 rows per byte
+# or one 0/1 byte per row, so a reader can load just the columns it needs
+import struct
+
+import numpy as np
+
+import table_loader
+from table_loader import UDLR_BITS
+
+DEFAULT_CHUNK_ROWS = 1 << 16
+# bits turned into text together when writing the csv
+CSV_GROUP_BITS = 8
+
+# magic, version, board size, key bits, value bits, encoding, row count,
+# rows per row group
+COLUMNAR_HEADER = struct.Struct('<4sHHHHHQQ')
+COLUMNAR_MAGIC = b'KRKC'
+COLUMNAR_VERSION = 1
+ENCODINGS = ('bits', 'bytes')
+
+def columnNames(boardSize):
+    # the csv header: BKX1.. for the key, KU.. RY2 for the value
+    posBits = table_loader.posBitLen(boardSize)
+    keyNames = [f"{piece}{axis}{i}" for piece in ('BK', 'WK', 'WR') for axis in ('X', 'Y')
+                for i in range(1, posBits + 1)]
+    valNames = ['KU', 'KD', 'KL', 'KR', 'RU', 'RD', 'RL', 'RR']
+    valNames += [f"R{axis}{i}" for axis in ('X', 'Y') for i in range(1, posBits + 1)]
+    assert len(valNames) == 2 * UDLR_BITS + 2 * posBits
+    return keyNames, valNames
+
+def _rowBits(packedKeys, packedValues, boardSize):
+    # (rows, key bits + value bits) 0/1 matrix, first column the most significant key bit
+    keyBits = table_loader.keyLen(boardSize)
+    valBits = table_loader.valLen(boardSize)
+    columns = []
+    for packed, width in ((packedKeys, keyBits), (packedValues, valBits)):
+        packed = np.asarray(packed, dtype=np.uint64)
+        shifts = np.arange(width - 1, -1, -1, dtype=np.uint64)
+        columns.append(((packed[:, None] >> shifts) & np.uint64(1)).astype(np.uint8))
+    return np.hstack(columns)
+
+def _csvGroups(names):
+    # for every CSV_GROUP_BITS columns, the text of all their bit values
+    groups = []
+    for first in range(0, len(names), CSV_GROUP_BITS):
+        group = names[first:first + CSV_GROUP_BITS]
+        width = len(group)
+        texts = []
+        for v in range(1 << width):
+            texts.append(",".join(name if (v >> (width - 1 - i)) & 1 else "~" + name
+                                  for i, name in enumerate(group)))
+        groups.append((first, width, np.array(texts, dtype=object)))
+    return groups
+
+def writeCsv(path, packedKeys, packedValues, boardSize, chunkRows = DEFAULT_CHUNK_ROWS,
+             lineterminator = "\n"):
+    keyNames, valNames = columnNames(boardSize)
+    names = keyNames + valNames
+    groups = _csvGroups(names)
+    with open(path, 'w', newline='') as f:
+        f.write(",".join(names) + lineterminator)
+        for start in range(0, len(packedKeys), chunkRows):
+            bits = _rowBits(packedKeys[start:start + chunkRows],
+                            packedValues[start:start + chunkRows], boardSize)
+            parts = []
+            for first, width, texts in groups:
+                weights = 1 << np.arange(width - 1, -1, -1)
+                parts.append(texts[bits[:, first:first + width] @ weights])
+            rows = [",".join(cells) for cells in zip(*parts)]
+            f.write(lineterminator.join(rows) + lineterminator)
+
+def _blockSize(rows, encoding):
+    return (rows + 7) // 8 if encoding == 'bits' else rows
+
+def writeColumnar(path, packedKeys, packedValues, boardSize, encoding = 'bits',
+                  rowGroupRows = DEFAULT_CHUNK_ROWS):
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding {encoding!r}, expected one of {ENCODINGS}")
+    keyBits = table_loader.keyLen(boardSize)
+    valBits = table_loader.valLen(boardSize)
+    with open(path, 'wb') as f:
+        f.write(COLUMNAR_HEADER.pack(COLUMNAR_MAGIC, COLUMNAR_VERSION, boardSize, keyBits,
+                                     valBits, ENCODINGS.index(encoding), len(packedKeys),
+                                     rowGroupRows))
+        for start in range(0, len(packedKeys), rowGroupRows):
+            bits = _rowBits(packedKeys[start:start + rowGroupRows],
+                            packedValues[start:start + rowGroupRows], boardSize)
+            columns = bits.T
+            if encoding == 'bits':
+                columns = np.packbits(columns, axis=1)
+            f.write(np.ascontiguousarray(columns).tobytes())
+
+class ColumnarTable:
+    # reads a writeColumnar file, column by column
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            header = f.read(COLUMNAR_HEADER.size)
+        if len(header) < COLUMNAR_HEADER.size:
+            raise ValueError(f"{path} is too short for a columnar table")
+        (magic, version, self.boardSize, self.keyBits, self.valBits, encoding,
+         self.rows, self.rowGroupRows) = COLUMNAR_HEADER.unpack(header)
+        if magic != COLUMNAR_MAGIC or version != COLUMNAR_VERSION:
+            raise ValueError(f"{path} is not a columnar table of version {COLUMNAR_VERSION}")
+        self.encoding = ENCODINGS[encoding]
+        keyNames, valNames = columnNames(self.boardSize)
+        self.names = keyNames + valNames
+        self.data = np.memmap(path, dtype=np.uint8, mode='r', offset=COLUMNAR_HEADER.size)
+
+    def __len__(self):
+        return self.rows
+
+    def rowGroups(self):
+        # (first row, rows, byte offset) of every row group
+        offset = 0
+        for start in range(0, self.rows, self.rowGroupRows):
+            rows = min(self.rowGroupRows, self.rows - start)
+            yield start, rows, offset
+            offset += len(self.names) * _blockSize(rows, self.encoding)
+
+    def _index(self, column):
+        return self.names.index(column) if isinstance(column, str) else column
+
+    def readGroup(self, offset, rows, column):
+        size = _blockSize(rows, self.encoding)
+        block = self.data[offset + self._index(column) * size:][:size]
+        if self.encoding == 'bits':
+            return np.unpackbits(block, count=rows)
+        return np.array(block)
+
+    def column(self, column):
+        # 0/1 uint8 array of one column over all row groups, by name or index
+        return np.concatenate([self.readGroup(offset, rows, column)
+                               for _, rows, offset in self.rowGroups()] or
+                              [np.zeros(0, dtype=np.uint8)])
+
+    def columns(self, names = None):
+        names = self.names if names is None else names
+        return {name: self.column(name) for name in names}
+
+    def packed(self):
+        # (keys, values) packed back into integers, as table_loader gives them
+        keys = np.zeros(self.rows, dtype=np.uint64)
+        values = np.zeros(self.rows, dtype=np.uint64)
+        for i in range(self.keyBits):
+            keys = (keys << np.uint64(1)) | self.column(i)
+        for i in range(self.keyBits, self.keyBits + self.valBits):
+            values = (values << np.uint64(1)) | self.column(i)
+        return keys, values
@@ -0,0 +1,119 @@
+# bulk loading of the tableGen outputs with numpy.
+# the same encoding as main_minimizer.readInputFile + convertToBits, done
+# with array operations on the whole table at once. keys and values come
+# out packed into integers, the first bit of the string being the most
+# significant one
+import numpy as np
+
+# columns of the (isWhiteTurn, isRookCaptured, BKx, BKy, WKx, WKy, WRx, WRy) rows
+IS_WHITE_TURN, IS_ROOK_CAPTURED, BKx, BKy, WKx, WKy, WRx, WRy = range(8)
+KEY_COLUMNS = (BKx, BKy, WKx, WKy, WRx, WRy)
+
+# number of bits for coding the direction
+UDLR_BITS = 4
+
+def posBitLen(boardSize):
+    if boardSize <= 4:
+        return 2
+    if boardSize <= 8:
+        return 3
+    raise ValueError('Not accepting board sizes above 8')
+
+def keyLen(boardSize):
+    return len(KEY_COLUMNS) * posBitLen(boardSize)
+
+def valLen(boardSize):
+    # king direction, rook direction, rook distance along x and y
+    return 2 * UDLR_BITS + 2 * posBitLen(boardSize)
+
+def _lastWins(ids):
+    # rows to keep when inserting ids into a dict one by one: the position
+    # of the first occurrence, and the row whose value ends up stored
+    _, first = np.unique(ids, return_index=True)
+    _, lastReversed = np.unique(ids[::-1], return_index=True)
+    last = len(ids) - 1 - lastReversed
+    order = np.argsort(first, kind='stable')
+    return first[order], last[order]
+
+def readTableArrays(path):
+    # returns (keys, values), both (n, 8) int arrays, with repeated keys
+    # resolved the way the lookup dict did: last value wins
+    data = np.loadtxt(path, dtype=np.int64, skiprows=1, ndmin=2)
+    if data.size == 0:
+        return np.zeros((0, 8), dtype=np.int64), np.zeros((0, 8), dtype=np.int64)
+    keys = data[0::2]
+    values = data[1::2]
+    ids = np.zeros(len(keys), dtype=np.int64)
+    for column in range(8):
+        ids = (ids << 8) | keys[:, column]
+    first, last = _lastWins(ids)
+    return keys[first], values[last]
+
+def encodeKeys(keys, boardSize):
+    posBits = posBitLen(boardSize)
+    packed = np.zeros(len(keys), dtype=np.uint64)
+    for column in KEY_COLUMNS:
+        packed = (packed << np.uint64(posBits)) | keys[:, column].astype(np.uint64)
+    return packed
+
+def _directions(key, value, xColumn, yColumn):
+    x1, y1 = key[:, xColumn], key[:, yColumn]
+    x2, y2 = value[:, xColumn], value[:, yColumn]
+    # up, down, left, right
+    return y2 > y1, y1 > y2, x1 > x2, x2 > x1
+
+def _packBits(bits):
+    packed = np.zeros(len(bits[0]), dtype=np.uint64)
+    for bit in bits:
+        packed = (packed << np.uint64(1)) | bit.astype(np.uint64)
+    return packed
+
+def encodeValues(keys, values, boardSize):
+    posBits = posBitLen(boardSize)
+    distanceBits = 2 * posBits
+    isKing = (keys[:, WKx] != values[:, WKx]) | (keys[:, WKy] != values[:, WKy])
+
+    # king: its four direction bits first, everything else 0
+    king = _packBits(_directions(keys, values, WKx, WKy))
+    king <<= np.uint64(UDLR_BITS + distanceBits)
+
+    # rook: direction bits after the king ones, then the distance, in the
+    # x half for up/down moves and in the y half otherwise
+    up, down, left, right = _directions(keys, values, WRx, WRy)
+    rook = _packBits((up, down, left, right)) << np.uint64(distanceBits)
+    distance = np.abs(keys[:, WRx] - values[:, WRx] + keys[:, WRy] - values[:, WRy])
+    distance = distance.astype(np.uint64) & np.uint64((1 << posBits) - 1)
+    vertical = up | down
+    distance[vertical] <<= np.uint64(posBits)
+    rook |= distance
+
+    return np.where(isKing, king, rook)
+
+def encodeTable(keys, values, boardSize):
+    # packed keys and values, with keys that encode the same resolved like
+    # in bitLookup: last value wins
+    packedKeys = encodeKeys(keys, boardSize)
+    packedValues = encodeValues(keys, values, boardSize)
+    first, last = _lastWins(packedKeys.astype(np.int64))
+    return packedKeys[first], packedValues[last]
+
+def loadPackedTable(path, boardSize):
+    keys, values = readTableArrays(path)
+    return encodeTable(keys, values, boardSize)
+
+def toBitStrings(packed, width):
+    # array of ints -> list of '0'/'1' strings of the given width
+    if len(packed) == 0:
+        return []
+    shifts = np.arange(width - 1, -1, -1, dtype=np.uint64)
+    bits = ((packed[:, None] >> shifts) & np.uint64(1)).astype(np.uint8) + ord('0')
+    return np.ascontiguousarray(bits).view(f'S{width}').ravel().astype(str).tolist()
+
+def toBitLookup(packedKeys, packedValues, boardSize):
+    keys = toBitStrings(packedKeys, keyLen(boardSize))
+    values = toBitStrings(packedValues, valLen(boardSize))
+    return dict(zip(keys, values))
+
+def loadBitLookup(path, boardSize):
+    # the bitLookup dict of main_minimizer, built in bulk
+    return toBitLookup(*loadPackedTable(path, boardSize), boardSize)
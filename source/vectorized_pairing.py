@@ -0,0 +1,321 @@
+# numpy backend for the pairing strategies of main_minimizer.
+# the table is packed into uint64 care/value arrays and canMerge/similarity
+# are computed for whole blocks of rows at once
+import heapq
+
+import numpy as np
+
+from merge_stats import counters
+
+# number of matrix cells computed at once, bounds memory on big tables
+DEFAULT_BLOCK_CELLS = 1 << 22
+
+if hasattr(np, 'bitwise_count'):
+    popcount = np.bitwise_count
+else:
+    _BYTE_COUNTS = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def popcount(x):
+        x = np.ascontiguousarray(x, dtype=np.uint64)
+        counts = _BYTE_COUNTS[x.view(np.uint8)].reshape(x.shape + (8,))
+        return counts.sum(axis=-1, dtype=np.uint8)
+
+
+def rowsPerBlock(numCols, chunkRows=None):
+    if chunkRows is not None:
+        return max(1, chunkRows)
+    return max(1, DEFAULT_BLOCK_CELLS // max(1, numCols))
+
+
+class PackedTable:
+    # tableList packed into arrays. merged blocks are interned into ids:
+    # mergedId[i] is the same for two rows when canMerge would find the same
+    # merged blocks, and postings[g] lists the rows holding block g
+    def __init__(self, tableList):
+        n = len(tableList)
+        self.care = np.zeros(n, dtype=np.uint64)
+        self.value = np.zeros(n, dtype=np.uint64)
+        self.mergedId = np.zeros(n, dtype=np.int64)
+        self.mergedIds = {}
+        self.groupIds = {}
+        # block id -> what a shared block adds to similarity
+        self.groupWeight = []
+        # block id -> row -> how many times the row holds the block
+        self.postings = []
+        # row -> block id -> count
+        self.rowGroups = [None] * n
+        for i, f in enumerate(tableList):
+            self._fill(i, f)
+
+    def __len__(self):
+        return len(self.rowGroups)
+
+    def _fill(self, i, f):
+        self.care[i] = f.care
+        self.value[i] = f.value
+        self.mergedId[i] = self.mergedIds.setdefault(f.groups, len(self.mergedIds))
+        groups = {}
+        for disj in f.merged:
+            g = self.groupIds.get(disj)
+            if g is None:
+                g = len(self.groupWeight)
+                self.groupIds[disj] = g
+                self.groupWeight.append(disj[0].care.bit_count())
+                self.postings.append({})
+            groups[g] = groups.get(g, 0) + 1
+        for g, count in groups.items():
+            self.postings[g][i] = count
+        self.rowGroups[i] = groups
+
+    def _clear(self, i):
+        for g in self.rowGroups[i]:
+            del self.postings[g][i]
+        self.rowGroups[i] = None
+
+    def replace(self, i, f):
+        self._clear(i)
+        self._fill(i, f)
+
+    def moveLastTo(self, j):
+        # mirrors tableList[j] = tableList.pop()
+        last = len(self) - 1
+        self._clear(j)
+        groups = self.rowGroups.pop()
+        for g, count in groups.items():
+            del self.postings[g][last]
+            self.postings[g][j] = count
+        self.rowGroups[j] = groups
+        self.care[j] = self.care[last]
+        self.value[j] = self.value[last]
+        self.mergedId[j] = self.mergedId[last]
+        self._shrink(last)
+
+    def popLast(self):
+        last = len(self) - 1
+        self._clear(last)
+        self.rowGroups.pop()
+        self._shrink(last)
+
+    def _shrink(self, size):
+        self.care = self.care[:size]
+        self.value = self.value[:size]
+        self.mergedId = self.mergedId[:size]
+
+    def blockScores(self, r0, r1, c0, c1):
+        # matrix of rows[r0:r1].similarity(rows[c0:c1]), 0 where canMerge is false
+        care = self.care[r0:r1, None]
+        colCare = self.care[None, c0:c1]
+        agree = care & colCare & ~(self.value[r0:r1, None] ^ self.value[None, c0:c1])
+        scores = popcount(agree).astype(np.int64)
+        for r in range(r0, r1):
+            self._addOverlap(scores[r - r0], r, c0, c1)
+        compatible = (care == colCare) | (self.mergedId[r0:r1, None] == self.mergedId[None, c0:c1])
+        scores[~compatible] = 0
+        # only the pairs with the column after the row are ever looked at
+        after = np.arange(c0, c1)[None, :] > np.arange(r0, r1)[:, None]
+        _count(compatible, after)
+        return scores
+
+    def rowScores(self, i, c0, c1):
+        return self.blockScores(i, i + 1, c0, c1)[0]
+
+    def colScores(self, j, r0, r1):
+        # rows[r0:r1].similarity(rows[j]), 0 where canMerge is false
+        care = self.care[r0:r1]
+        agree = care & self.care[j] & ~(self.value[r0:r1] ^ self.value[j])
+        scores = popcount(agree).astype(np.int64)
+        for g in self.rowGroups[j]:
+            weight = self.groupWeight[g]
+            for r, count in self.postings[g].items():
+                if r0 <= r < r1:
+                    scores[r - r0] += weight * count
+        compatible = (care == self.care[j]) | (self.mergedId[r0:r1] == self.mergedId[j])
+        scores[~compatible] = 0
+        _count(compatible, np.arange(r0, r1) < j)
+        return scores
+
+    def _addOverlap(self, row, i, c0, c1):
+        # similarity adds the weight of every block of i found in the other row
+        for g, count in self.rowGroups[i].items():
+            postings = self.postings[g]
+            if len(postings) < 2:
+                continue
+            cols = np.fromiter(postings.keys(), dtype=np.int64, count=len(postings))
+            cols = cols[(cols >= c0) & (cols < c1)]
+            row[cols - c0] += self.groupWeight[g] * count
+
+
+def _count(compatible, after):
+    # every cell pairing a row with a later one is one canMerge check,
+    # the compatible ones get a similarity, like the python backend counts
+    checked = int(np.count_nonzero(after))
+    passed = int(np.count_nonzero(compatible & after))
+    counters.canMergeCalls += checked
+    counters.rejections += checked - passed
+    counters.similarityCalls += passed
+
+
+def _upperScores(packed, r0, r1, n):
+    # block scores with every column j <= row masked out
+    scores = packed.blockScores(r0, r1, 0, n)
+    rows = np.arange(r0, r1)[:, None]
+    scores[np.arange(n)[None, :] <= rows] = 0
+    return scores
+
+
+def _mergeAt(tableList, packed, i, j):
+    paired = tableList[i].merge(tableList[j])
+    # store it instead of i, and delete j
+    tableList[i] = paired
+    packed.replace(i, paired)
+    if j != len(tableList) - 1:
+        tableList[j] = tableList.pop()
+        packed.moveLastTo(j)
+    else:
+        tableList.pop()
+        packed.popLast()
+
+
+def greedyPairing(tableList, chunkRows=None):
+    # vectorized onePairingIteration: every row, in order, merges with its
+    # first most similar row after it
+    packed = PackedTable(tableList)
+    r0 = 0
+    while r0 < len(tableList) - 1:
+        n = len(tableList)
+        r1 = min(n, r0 + rowsPerBlock(n, chunkRows))
+        scores = _upperScores(packed, r0, r1, n)
+        for r in range(r0, r1):
+            n = len(tableList)
+            if r >= n - 1:
+                break
+            row = scores[r - r0, :n]
+            j = int(row.argmax())
+            if row[j] <= 0:
+                continue
+            last = n - 1
+            _mergeAt(tableList, packed, r, j)
+            n -= 1
+            if j == last or r + 1 >= r1:
+                continue
+            # row j now holds what was the last row
+            if j < r1:
+                scores[r + 1 - r0:j - r0, j] = packed.colScores(j, r + 1, j)
+                scores[j - r0, :] = 0
+                scores[j - r0, j + 1:n] = packed.rowScores(j, j + 1, n)
+            else:
+                scores[r + 1 - r0:, j] = packed.colScores(j, r + 1, r1)
+        r0 = r1
+    return tableList
+
+
+def _bestPairScan(packed, chunkRows=None):
+    # first (i, j) in row-major order with the highest similarity
+    n = len(packed)
+    bestCost, indexi, indexj = 0, None, None
+    step = rowsPerBlock(n, chunkRows)
+    for r0 in range(0, n - 1, step):
+        r1 = min(n - 1, r0 + step)
+        scores = _upperScores(packed, r0, r1, n)
+        flat = int(scores.argmax())
+        r, j = divmod(flat, n)
+        if scores[r, j] > bestCost:
+            bestCost, indexi, indexj = int(scores[r, j]), r0 + r, j
+    return bestCost, indexi, indexj
+
+
+def bestPairMerge(tableList, chunkRows=None):
+    # vectorized onlyPairBestOnes: merges the single best pair
+    packed = PackedTable(tableList)
+    _, i, j = _bestPairScan(packed, chunkRows)
+    if i is not None:
+        _mergeAt(tableList, packed, i, j)
+    return tableList
+
+
+class VectorizedBestPairEngine:
+    # numpy version of main_minimizer.BestPairEngine: the best partner of
+    # every row lives in arrays, and a heap of (similarity, i, j) picks the
+    # next merge. after a merge only the columns of the changed rows and
+    # the rows that pointed at them are recomputed
+    def __init__(self, tableList, chunkRows=None):
+        self.tableList = tableList
+        self.packed = PackedTable(tableList)
+        n = len(tableList)
+        self.bestCost = np.zeros(n, dtype=np.int64)
+        self.bestIndex = np.full(n, -1, dtype=np.int64)
+        self.stamps = np.zeros(n, dtype=np.int64)
+        step = rowsPerBlock(n, chunkRows)
+        for r0 in range(0, n, step):
+            r1 = min(n, r0 + step)
+            scores = _upperScores(self.packed, r0, r1, n)
+            self.bestIndex[r0:r1] = scores.argmax(axis=1)
+            self.bestCost[r0:r1] = scores.max(axis=1)
+        self.bestIndex[self.bestCost <= 0] = -1
+        self.heap = [(-int(self.bestCost[k]), k, int(self.bestIndex[k]), 0)
+                     for k in np.flatnonzero(self.bestIndex >= 0).tolist()]
+        heapq.heapify(self.heap)
+
+    def _recompute(self, k):
+        n = len(self.tableList)
+        bestCost, index = 0, -1
+        if k + 1 < n:
+            row = self.packed.rowScores(k, k + 1, n)
+            j = int(row.argmax())
+            if row[j] > 0:
+                bestCost, index = int(row[j]), k + 1 + j
+        self.bestCost[k] = bestCost
+        self.bestIndex[k] = index
+
+    def _popBest(self):
+        heap = self.heap
+        length = len(self.tableList)
+        while heap:
+            _, i, j, stamp = heap[0]
+            if i < length and stamp == self.stamps[i]:
+                return i, j
+            heapq.heappop(heap)
+        return None, None
+
+    def mergeBest(self, tableList):
+        assert tableList is self.tableList
+        i, j = self._popBest()
+        if i is None:
+            return tableList
+        last = len(tableList) - 1
+        _mergeAt(tableList, self.packed, i, j)
+        n = len(tableList)
+        self.bestCost = self.bestCost[:n]
+        self.bestIndex = self.bestIndex[:n]
+        self.stamps = self.stamps[:n]
+
+        changed = np.isin(self.bestIndex, (i, j, last))
+        changed[i] = True
+        if j < n:
+            changed[j] = True
+        updated = changed.copy()
+        # the rows that got new formulas may beat the current best
+        for x in (i, j):
+            if x >= n or x == 0:
+                continue
+            scores = self.packed.colScores(x, 0, x)
+            cost = self.bestCost[:x]
+            index = self.bestIndex[:x]
+            better = (scores > cost) | ((scores == cost) & (scores > 0) & (x < index))
+            better &= ~changed[:x]
+            cost[better] = scores[better]
+            index[better] = x
+            updated[:x] |= better
+        for k in np.flatnonzero(changed).tolist():
+            self._recompute(k)
+
+        for k in np.flatnonzero(updated).tolist():
+            self.stamps[k] += 1
+            if self.bestIndex[k] >= 0:
+                heapq.heappush(self.heap, (-int(self.bestCost[k]), k,
+                                           int(self.bestIndex[k]), int(self.stamps[k])))
+        if len(self.heap) > 4 * n + 64:
+            self.heap = [(-int(self.bestCost[k]), k, int(self.bestIndex[k]), int(self.stamps[k]))
+                         for k in np.flatnonzero(self.bestIndex >= 0).tolist()]
+            heapq.heapify(self.heap)
+        return tableList